@@ -163,6 +163,10 @@ export default function UploadModal({
     const formData = new FormData();
     formData.append("file", selectedFile);
     formData.append("userId", userId);
+    // Merging: leave out rows this user already got from an earlier statement.
+    if (uploadMode === "merge") {
+      formData.append("dedup", "user");
+    }
 
     try {
       // 1. Upload file to text-extract API
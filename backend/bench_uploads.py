@@ -0,0 +1,77 @@
+import time
+import asyncio
+import argparse
+
+import httpx
+
+# Concurrent-upload benchmark for a running backend:
+#   uvicorn main:app --port 8080 &
+#   python bench_uploads.py statement.pdf --concurrency 8 --requests 32
+# While the uploads run, GET / is polled to show whether the event loop stays responsive.
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def summary(name, latencies):
+    ms = [s * 1000 for s in latencies]
+    print(f"{name:<10} n={len(ms):<5} p50={percentile(ms, 50):8.1f}ms  p95={percentile(ms, 95):8.1f}ms  "
+          f"max={max(ms, default=0):8.1f}ms")
+
+
+async def upload(client, url, pdf_bytes, stream, latencies, statuses):
+    params = {"stream": stream} if stream else None
+    start = time.perf_counter()
+    response = await client.post(f"{url}/extract-text", params=params,
+                                 files={"file": ("statement.pdf", pdf_bytes, "application/pdf")},
+                                 data={"userId": "bench"})
+    latencies.append(time.perf_counter() - start)
+    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+
+async def ping(client, url, latencies, done, interval=0.05):
+    while not done.is_set():
+        start = time.perf_counter()
+        await client.get(f"{url}/")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+
+
+async def run(url, pdf_path, concurrency, total, stream):
+    with open(pdf_path, "rb") as f:
+        pdf_bytes = f.read()
+    upload_latencies, ping_latencies, statuses = [], [], {}
+    slots = asyncio.Semaphore(concurrency)
+    done = asyncio.Event()
+
+    async def one(client):
+        async with slots:
+            await upload(client, url, pdf_bytes, stream, upload_latencies, statuses)
+
+    async with httpx.AsyncClient(timeout=600) as client:
+        pinger = asyncio.create_task(ping(client, url, ping_latencies, done))
+        started = time.perf_counter()
+        await asyncio.gather(*(one(client) for _ in range(total)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await pinger
+
+    print(f"📄 {pdf_path} ({len(pdf_bytes) / 1e6:.2f} MB), {total} uploads, {concurrency} concurrent")
+    summary("upload", upload_latencies)
+    summary("GET /", ping_latencies)
+    print(f"⚡ {total / elapsed:.2f} uploads/s, status codes: {statuses}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure /extract-text latency under concurrent uploads.")
+    parser.add_argument("pdf")
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--stream", choices=["ndjson", "sse"], help="use the streaming response mode")
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.pdf, args.concurrency, args.requests, args.stream))
@@ -0,0 +1,92 @@
+import os
+import asyncio
+from collections import deque
+
+import httpx
+import msgpack
+
+import metrics
+
+# Base URL of the model server (model-training/server.py), e.g. http://categorizer:8080.
+CATEGORIZER_URL = os.environ.get("CATEGORIZER_URL", "").rstrip("/")
+# Transactions per /bulk_predict call.
+CATEGORIZE_BATCH_SIZE = int(os.environ.get("CATEGORIZE_BATCH_SIZE", 128))
+# /bulk_predict calls outstanding while parsing continues; beyond this, parsing waits.
+CATEGORIZE_MAX_IN_FLIGHT = int(os.environ.get("CATEGORIZE_MAX_IN_FLIGHT", 4))
+CATEGORIZE_TIMEOUT_S = float(os.environ.get("CATEGORIZE_TIMEOUT_S", 60))
+
+MSGPACK = "application/x-msgpack"
+# Transaction fields the model server uses (model-training/text_prep.py).
+MODEL_FIELDS = ("description", "transactionType", "amount")
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        # One pooled client: batches reuse keep-alive connections to the model server.
+        _client = httpx.AsyncClient(base_url=CATEGORIZER_URL, timeout=CATEGORIZE_TIMEOUT_S)
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def categorize_batch(transactions):
+    # /bulk_predict rejects rows without a description; those come back as "Other".
+    send = [txn for txn in transactions if txn.get("description")]
+    predictions = iter([])
+    if send:
+        metrics.CATEGORIZE_BATCH_SIZE.observe(len(send))
+        # Only the fields the model reads go out, as MessagePack columns, and only
+        # the predictions come back (echo=0); they are merged into the rows here.
+        body = msgpack.packb({field: [txn.get(field) for txn in send] for field in MODEL_FIELDS})
+        with metrics.stage("categorize"):
+            response = await get_client().post("/bulk_predict", params={"echo": "0"}, content=body,
+                                               headers={"Content-Type": MSGPACK, "Accept": MSGPACK})
+        if response.status_code != 200:
+            raise RuntimeError(f"Categorizer returned {response.status_code}: {response.text[:200]}")
+        result = msgpack.unpackb(response.content)
+        predictions = (
+            {"category": category, "confidence": confidence, "source": source}
+            for category, confidence, source in zip(result["category"], result["confidence"], result["source"])
+        )
+    # Same "empty" source as the batch CLI, so every row says where its category came from.
+    empty = {"category": "Other", "confidence": 0.0, "source": "empty"}
+    return [{**txn, **(next(predictions) if txn.get("description") else empty)} for txn in transactions]
+
+
+async def categorize_stream(rows, batch_size=None, max_in_flight=None):
+    """Categorized transactions, in order, from an async iterator of parsed ones.
+
+    Full batches are sent as soon as they fill, so the model server works on
+    one batch while the next pages are still being parsed.
+    """
+    batch_size = batch_size or CATEGORIZE_BATCH_SIZE
+    max_in_flight = max_in_flight or CATEGORIZE_MAX_IN_FLIGHT
+    in_flight = deque()
+    batch = []
+    try:
+        async for txn in rows:
+            batch.append(txn)
+            if len(batch) < batch_size:
+                continue
+            in_flight.append(asyncio.ensure_future(categorize_batch(batch)))
+            batch = []
+            # Hand out whatever has already come back, in order, without waiting.
+            while in_flight and (in_flight[0].done() or len(in_flight) > max_in_flight):
+                for row in await in_flight.popleft():
+                    yield row
+        if batch:
+            in_flight.append(asyncio.ensure_future(categorize_batch(batch)))
+        while in_flight:
+            for row in await in_flight.popleft():
+                yield row
+    finally:
+        for task in in_flight:
+            task.cancel()
@@ -1,11 +1,39 @@
 
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse
-import pdfplumber
-import tempfile
+from fastapi import FastAPI, UploadFile, File, Form, Query
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
+from typing import List
+import asyncio
+import json
 import os
+import tempfile
+import threading
+import time
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import datetime
+from statement_parser import PDF_WORKERS, iter_page_lines, iter_transactions, shutdown_pool
+from statement_cache import SeenReferences, StatementCache
+from categorizer import CATEGORIZER_URL, categorize_stream, close_client
+import metrics
+import sampling_profiler
+
+# Statements parsed at the same time; further uploads wait for a slot.
+PARSE_CONCURRENCY = int(os.environ.get("PARSE_CONCURRENCY", max(2, PDF_WORKERS)))
+# Uploads allowed to wait; beyond that the server answers 503 instead of queueing.
+PARSE_QUEUE_LIMIT = int(os.environ.get("PARSE_QUEUE_LIMIT", 4 * PARSE_CONCURRENCY))
+MAX_UPLOAD_MB = float(os.environ.get("MAX_UPLOAD_MB", 20))
+# Whole multipart body (all files of a request); checked against Content-Length before it is read.
+MAX_REQUEST_MB = float(os.environ.get("MAX_REQUEST_MB", 4 * MAX_UPLOAD_MB))
+# Uploads are hashed for the statement cache in chunks of this size.
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Parsed statements by content hash; an empty STATEMENT_CACHE_DIR disables the cache.
+STATEMENT_CACHE_DIR = os.environ.get("STATEMENT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "statement-cache"))
+STATEMENT_CACHE_TTL_S = int(os.environ.get("STATEMENT_CACHE_TTL_S", 7 * 24 * 3600))
+STATEMENT_CACHE_MAX_MB = float(os.environ.get("STATEMENT_CACHE_MAX_MB", 256))
+# References returned to each user, for dedup across requests (dedup=user); "" disables.
+SEEN_REFERENCES_DIR = os.environ.get("SEEN_REFERENCES_DIR", os.path.join(tempfile.gettempdir(), "seen-references"))
+SEEN_REFERENCES_TTL_S = int(os.environ.get("SEEN_REFERENCES_TTL_S", 180 * 24 * 3600))
+# Expose GET /debug/profile (sampled stacks of the server process).
+PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED", "0") == "1"
 
 app = FastAPI()
 
@@ -18,124 +46,318 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def pdf_to_json(file_path, userId=""):
-    transactions = []
-    with pdfplumber.open(file_path) as pdf:
-        lines = []
-        # Combine text lines from each page
-        for page in pdf.pages:
-            text = page.extract_text()
-            if text:
-                lines.extend(text.split("\n"))
-
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        # Check if this line represents a transaction (contains DEBIT or CREDIT)
-        if "DEBIT" in line or "CREDIT" in line:
-            try:
-                # Assuming the first part of the line is the date (e.g., "Apr 09, 2025")
-                date_part = line.split(" ")[0:3]  # e.g., ["Apr", "09,", "2025"]
-                transaction_date_str = " ".join(date_part)  # "Apr 09, 2025"
-                remainder = line.replace(transaction_date_str, "").strip()
-
-                # Extract description based on keywords
-                if "Paid to" in remainder:
-                    description = remainder.split("Paid to")[1].split("DEBIT")[0].strip()
-                    transaction_type = "DEBIT"
-                elif "Received from" in remainder:
-                    description = remainder.split("Received from")[1].split("CREDIT")[0].strip()
-                    transaction_type = "CREDIT"
-                else:
-                    description = ""
-                    transaction_type = ""
-
-                # Extract amount after the rupee symbol "₹"
-                if "₹" in remainder:
-                    amount_str = remainder.split("₹")[-1].replace(",", "").strip()
-                    try:
-                        amount = float(amount_str)
-                    except ValueError:
-                        amount = 0
-                else:
-                    amount = 0
-
-                # Extract additional information from the next lines:
-                txn_line = lines[i + 1] if i + 1 < len(lines) else ""
-                time_part = txn_line.split()[0] if txn_line.split() else "00:00"
-
-                # Combine date and time and parse into ISO format, if possible
-                try:
-                    full_datetime = datetime.strptime(transaction_date_str + " " + time_part, "%b %d, %Y %H:%M")
-                    createdAt = full_datetime.isoformat() + "Z"
-                    date_only = full_datetime.strftime("%Y-%m-%dT00:00:00.000Z")
-                except Exception:
-                    createdAt = ""
-                    date_only = ""
-
-                if "Transaction ID" in txn_line:
-                    transaction_id = txn_line.split("Transaction ID")[-1].strip()
-                else:
-                    transaction_id = ""
-
-                # Line for UTR No (if needed, but not mapped to final format)
-                utr_line = lines[i + 2] if i + 2 < len(lines) else ""
-                if "UTR No." in utr_line:
-                    utr_no = utr_line.split("UTR No.")[-1].strip()
-                else:
-                    utr_no = ""
-
-                # Paid/Credited by information (if needed, but not mapped to final output)
-                paid_line = lines[i + 3] if i + 3 < len(lines) else ""
-                if paid_line:
-                    paid_by = paid_line.split()[-1].strip()
-                else:
-                    paid_by = ""
-
-                # Build transaction dictionary using the required keys.
-                txn = {
-                    "amount": amount,
-                    "createdAt": createdAt,
-                    "date": date_only,
-                    "description": description,
-                    "transactionId": transaction_id,
-                     "transactionType": transaction_type,
-                    "userId": userId,
-                }
-                transactions.append(txn)
-                # Skip the 4 lines that we processed as part of this transaction block.
-                i += 4
-            except Exception as e:
-                print(f"Skipping line due to error: {e}")
-                i += 1
-        else:
-            i += 1
-
-    return transactions
+statement_cache = StatementCache(STATEMENT_CACHE_DIR, ttl=STATEMENT_CACHE_TTL_S,
+                                 max_bytes=int(STATEMENT_CACHE_MAX_MB * 1024 * 1024))
+seen_references = SeenReferences(SEEN_REFERENCES_DIR, ttl=SEEN_REFERENCES_TTL_S)
+DEDUP_MODES = ("request", "user")
+
+@app.middleware("http")
+async def time_requests(request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # The route template, not the raw path, keeps the label set small.
+    route = request.scope.get("route")
+    metrics.REQUEST_SECONDS.labels(route.path if route else "other", str(response.status_code)).observe(
+        time.perf_counter() - start)
+    return response
+
+UPLOAD_ROUTES = {"/extract-text", "/extract-and-categorize"}
+
+@app.middleware("http")
+async def limit_request_size(request, call_next):
+    # Runs before the multipart parser receives and spools the body.
+    if request.method == "POST" and request.url.path in UPLOAD_ROUTES:
+        try:
+            length = int(request.headers.get("content-length", 0))
+        except ValueError:
+            length = 0
+        if length > MAX_REQUEST_MB * 1024 * 1024:
+            return JSONResponse(content={"error": f"Request larger than {MAX_REQUEST_MB:g} MB"}, status_code=413)
+    return await call_next(request)
+
+@app.on_event("shutdown")
+async def stop_workers():
+    shutdown_pool()
+    await close_client()
 
 # Root endpoint
 @app.get("/")
 def home():
     return {"msg": "FastAPI is working!"}
 
+# ----- Parse Slots (bounded concurrency with backpressure) -----
+_parse_slots = None
+_parse_waiting = 0
+
+async def acquire_parse_slot():
+    # False when every slot is busy and the wait queue is full.
+    global _parse_slots, _parse_waiting
+    if _parse_slots is None:
+        # Created on first use so it belongs to the server's event loop.
+        _parse_slots = asyncio.Semaphore(PARSE_CONCURRENCY)
+    if _parse_slots.locked() and _parse_waiting >= PARSE_QUEUE_LIMIT:
+        return False
+    _parse_waiting += 1
+    try:
+        await _parse_slots.acquire()
+    finally:
+        _parse_waiting -= 1
+    return True
+
+def release_parse_slot():
+    _parse_slots.release()
+
+metrics.PARSE_QUEUE.set_function(lambda: _parse_waiting)
+
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+def stream_event(payload, fmt, event=None):
+    data = json.dumps(payload, ensure_ascii=False)
+    if fmt == "sse":
+        return (f"event: {event}\n" if event else "") + f"data: {data}\n\n"
+    return data + "\n"
+
+def upload_source(upload):
+    # The multipart parser has already spooled the upload: in memory up to its
+    # spool size (1 MB), in an unnamed temp file beyond. Page workers open the
+    # temp file through /proc instead of receiving a copy; small in-memory
+    # uploads are passed as bytes.
+    spooled = upload.file
+    if getattr(spooled, "_rolled", False) and os.path.isdir("/proc/self/fd"):
+        return f"/proc/{os.getpid()}/fd/{spooled.fileno()}"
+    spooled.seek(0)
+    return spooled.read()
+
+def upload_key(upload):
+    h = statement_cache.hasher()
+    upload.file.seek(0)
+    for chunk in iter(lambda: upload.file.read(UPLOAD_CHUNK_BYTES), b""):
+        h.update(chunk)
+    return statement_cache.key_of(h)
+
+async def read_uploads(files):
+    """(source, cache key) per upload, or None if one is larger than MAX_UPLOAD_MB."""
+    if any(upload.size is not None and upload.size > MAX_UPLOAD_MB * 1024 * 1024 for upload in files):
+        return None
+    statements = []
+    for upload in files:
+        with metrics.stage("read_upload"):
+            key = await run_in_threadpool(upload_key, upload)
+            statements.append((upload_source(upload), key))
+    return statements
+
+def statement_rows(source, key):
+    # One statement's transactions (userId unset): cached, or parsed and then cached.
+    with metrics.stage("cache_get"):
+        cached = statement_cache.get(key)
+    if cached is not None:
+        yield from cached
+        return
+    rows = []
+    pages = metrics.IterTimer(iter_page_lines(source))
+    transactions = metrics.IterTimer(iter_transactions(pages))
+    for txn in transactions:
+        rows.append(txn)
+        yield txn
+    metrics.record_statement(pages, transactions)
+    # Only a complete parse is stored, never one cut short by a disconnect.
+    with metrics.stage("cache_put"):
+        statement_cache.put(key, rows)
+
+def extract_rows(statements, userId, dedup="request"):
+    # Transactions of every statement uploaded in this request, in order.
+    # Overlapping statements repeat rows; a row whose UTR (or transactionId when
+    # there is none) already appeared in this request is dropped. With
+    # dedup="user", so is one already returned to this userId by an earlier
+    # request (e.g. merging the next month's statement into a saved file).
+    seen = seen_references.get(userId) if dedup == "user" else set()
+    returned = []
+    try:
+        for source, key in statements:
+            for txn in statement_rows(source, key):
+                reference = txn.get("utr") or txn["transactionId"]
+                if reference:
+                    if reference in seen:
+                        continue
+                    seen.add(reference)
+                    returned.append(reference)
+                yield {**txn, "userId": userId}
+    except Exception:
+        returned.clear()  # the request fails, so its rows count as never returned
+        raise
+    finally:
+        # Recorded in either mode, so a later dedup="user" upload skips these rows.
+        seen_references.add(userId, returned)
+
+class ThreadedRows:
+    """extract_rows() as consumed from threadpool threads, closable from the event loop.
+
+    A stream that ends early must close the generator so the statement_rows()
+    below it cancels its page extraction now instead of at GC. A next() may
+    still be running in a thread at that point (the await on it was cancelled);
+    the generator is then closed by that thread as soon as the call returns.
+    """
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._lock = threading.Lock()
+        self._closing = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self._lock:
+            if self._closing:
+                raise StopIteration
+            row = next(self._rows)
+        if self._closing:
+            self._close_now()
+        return row
+
+    def _close_now(self):
+        with self._lock:
+            self._rows.close()
+
+    def close(self):
+        self._closing = True
+        if self._lock.acquire(blocking=False):
+            try:
+                self._rows.close()
+            finally:
+                self._lock.release()
+
+class ClosingStreamingResponse(StreamingResponse):
+    # A client that disconnects mid-stream leaves the body generator suspended at
+    # a yield, so its finally (which releases the parse slot) would never run.
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+
+def streaming_response(body, fmt):
+    return ClosingStreamingResponse(body, media_type=STREAM_MEDIA_TYPES[fmt])
+
+async def stream_transactions(statements, userId, dedup, fmt, holds_slot):
+    # Rows go out as soon as their page is parsed; the parse slot is held
+    # until the stream ends or the client disconnects.
+    count = 0
+    rows = ThreadedRows(extract_rows(statements, userId, dedup))
+    try:
+        async for txn in iterate_in_threadpool(rows):
+            count += 1
+            yield stream_event(txn, fmt)
+        if fmt == "sse":
+            yield stream_event({"count": count}, fmt, event="done")
+    except Exception as e:
+        yield stream_event({"error": str(e)}, fmt, event="error")
+    finally:
+        rows.close()
+        if holds_slot:
+            release_parse_slot()
+
 @app.post("/extract-text")
 async def extract_text(
-    file: UploadFile = File(...),
-    userId: str = Form("")
+    file: List[UploadFile] = File(...),
+    userId: str = Form(""),
+    dedup: str = Form("request", description="'request', or 'user' to also drop rows returned to userId before"),
+    stream: str = Query("", description="'ndjson' or 'sse' to stream rows as pages are parsed")
 ):
+    # Several statements may be sent as repeated "file" parts; their rows are merged.
     print(f"Received userId: {userId}")  # Debug log
     print(f"no userId: {userId}")
 
+    if stream and stream not in STREAM_MEDIA_TYPES:
+        return JSONResponse(content={"error": "stream must be 'ndjson' or 'sse'"}, status_code=400)
+    if dedup not in DEDUP_MODES:
+        return JSONResponse(content={"error": "dedup must be 'request' or 'user'"}, status_code=400)
+
+    # Parsed straight from the multipart parser's spool (open until the response ends).
+    statements = await read_uploads(file)
+    if statements is None:
+        return JSONResponse(content={"error": f"File larger than {MAX_UPLOAD_MB:g} MB"}, status_code=413)
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp:
-        temp.write(await file.read())
-        temp_path = temp.name
+    # Re-uploads are answered from the cache without waiting for a parse slot.
+    holds_slot = not all(statement_cache.contains(key) for _, key in statements)
+    if holds_slot and not await acquire_parse_slot():
+        return JSONResponse(content={"error": "Server busy, retry shortly"}, status_code=503,
+                            headers={"Retry-After": "1"})
+
+    if stream:
+        return streaming_response(stream_transactions(statements, userId, dedup, stream, holds_slot), stream)
 
     try:
-        data = pdf_to_json(temp_path, userId=userId)
+        # Parsing is CPU-bound: keep it off the event loop.
+        data = await run_in_threadpool(list, extract_rows(statements, userId, dedup))
         return JSONResponse(content=data)
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
     finally:
-        os.remove(temp_path)
+        if holds_slot:
+            release_parse_slot()
+
+async def stream_categorized(statements, userId, dedup, fmt, holds_slot):
+    # Parsing (threadpool + page workers) and categorization (model server)
+    # overlap: each full batch goes out while the next pages are parsed.
+    count = 0
+    rows = ThreadedRows(extract_rows(statements, userId, dedup))
+    try:
+        async for txn in categorize_stream(iterate_in_threadpool(rows)):
+            count += 1
+            yield stream_event(txn, fmt)
+        if fmt == "sse":
+            yield stream_event({"count": count}, fmt, event="done")
+    except Exception as e:
+        yield stream_event({"error": str(e)}, fmt, event="error")
+    finally:
+        rows.close()
+        if holds_slot:
+            release_parse_slot()
+
+@app.post("/extract-and-categorize")
+async def extract_and_categorize(
+    file: List[UploadFile] = File(...),
+    userId: str = Form(""),
+    dedup: str = Form("request", description="'request', or 'user' to also drop rows returned to userId before"),
+    stream: str = Query("ndjson", description="'ndjson' or 'sse'")
+):
+    # One call instead of /extract-text followed by the model server's /bulk_predict;
+    # categorized rows stream out as they are ready.
+    if not CATEGORIZER_URL:
+        return JSONResponse(content={"error": "CATEGORIZER_URL is not configured"}, status_code=503)
+    if stream not in STREAM_MEDIA_TYPES:
+        return JSONResponse(content={"error": "stream must be 'ndjson' or 'sse'"}, status_code=400)
+    if dedup not in DEDUP_MODES:
+        return JSONResponse(content={"error": "dedup must be 'request' or 'user'"}, status_code=400)
+
+    statements = await read_uploads(file)
+    if statements is None:
+        return JSONResponse(content={"error": f"File larger than {MAX_UPLOAD_MB:g} MB"}, status_code=413)
+
+    holds_slot = not all(statement_cache.contains(key) for _, key in statements)
+    if holds_slot and not await acquire_parse_slot():
+        return JSONResponse(content={"error": "Server busy, retry shortly"}, status_code=503,
+                            headers={"Retry-After": "1"})
+
+    return streaming_response(stream_categorized(statements, userId, dedup, stream, holds_slot), stream)
+
+@app.get("/cache_stats")
+def cache_stats():
+    return statement_cache.stats()
+
+@app.get("/metrics")
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
 
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = 10, interval_ms: float = 5, idle: bool = False):
+    # Opt-in: sampled stacks of the server process (page extraction runs in the
+    # pool's processes and is not included), in collapsed-stack format.
+    if not PROFILER_ENABLED:
+        return JSONResponse(content={"error": "Set PROFILER_ENABLED=1 to allow profiling"}, status_code=404)
+    stacks = await run_in_threadpool(sampling_profiler.profile, seconds, interval_ms / 1000, idle)
+    if stacks is None:
+        return JSONResponse(content={"error": "A profile is already running"}, status_code=409)
+    return PlainTextResponse(stacks)
@@ -0,0 +1,93 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, Gauge, Histogram, generate_latest
+
+# Prometheus metrics for main.py, served at GET /metrics.
+
+STAGES = ["read_upload", "cache_get", "extract", "parse", "cache_put", "categorize"]
+
+STAGE_SECONDS = Histogram(
+    "statement_stage_seconds", "Time spent in each stage of a statement upload", ["stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+REQUEST_SECONDS = Histogram(
+    "backend_request_seconds", "Time to the response headers (streamed bodies continue after)", ["path", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+STATEMENT_PAGES = Histogram("statement_pages", "Pages per parsed statement",
+                            buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+STATEMENT_ROWS = Histogram("statement_rows", "Transactions per parsed statement",
+                           buckets=(1, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000))
+CATEGORIZE_BATCH_SIZE = Histogram("categorize_batch_size", "Transactions per /bulk_predict call",
+                                  buckets=(1, 8, 16, 32, 64, 128, 256, 512, 1024))
+MEMORY_BYTES = Gauge("backend_memory_bytes", "Server process memory from /proc/self/smaps_rollup (at scrape time)",
+                     ["kind"])
+PARSE_QUEUE = Gauge("parse_queue_waiting", "Uploads waiting for a parse slot")
+
+_stage_timers = {name: STAGE_SECONDS.labels(name) for name in STAGES}
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stage_timers[name].observe(time.perf_counter() - start)
+
+
+def observe_stage(name, seconds):
+    _stage_timers[name].observe(seconds)
+
+
+class IterTimer:
+    """Iterator wrapper that adds up the time spent inside next() and counts items."""
+
+    def __init__(self, iterable):
+        self._it = iter(iterable)
+        self.seconds = 0.0
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            item = next(self._it)
+        finally:
+            self.seconds += time.perf_counter() - start
+        self.count += 1
+        return item
+
+
+def record_statement(pages, transactions):
+    # pages / transactions: the IterTimers around iter_page_lines and
+    # iter_transactions. Parsing pulls the pages, so its time includes the
+    # extraction wait, which is subtracted. Extraction runs in the pool's
+    # processes; its time here is how long the parser waited for pages.
+    observe_stage("extract", pages.seconds)
+    observe_stage("parse", transactions.seconds - pages.seconds)
+    STATEMENT_PAGES.observe(pages.count)
+    STATEMENT_ROWS.observe(transactions.count)
+
+
+def memory_usage_bytes():
+    usage = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB" and parts[0] in ("Rss:", "Pss:"):
+                    usage[parts[0].rstrip(":").lower()] = int(parts[1]) * 1024
+    except OSError:
+        pass
+    return usage
+
+
+def render():
+    """(body, content type) of the Prometheus text exposition."""
+    for kind, value in memory_usage_bytes().items():
+        MEMORY_BYTES.labels(kind).set(value)
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,176 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import threading
+
+from statement_formats import PARSER_VERSION
+
+
+class StatementCache:
+    """Parsed transactions on local disk, keyed by a hash of the PDF bytes and the parser version.
+
+    One gzipped JSON file per statement. Entries expire after ttl seconds;
+    when the directory grows past max_bytes the least recently read files
+    are deleted.
+    """
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    def key(self, pdf_bytes):
+        h = self.hasher()
+        h.update(pdf_bytes)
+        return self.key_of(h)
+
+    @staticmethod
+    def hasher():
+        # For hashing a PDF in chunks (e.g. while an upload is copied to disk); see key_of().
+        return hashlib.blake2b(digest_size=20)
+
+    @staticmethod
+    def key_of(h):
+        # A parser change must not serve rows parsed by the old one.
+        h.update(PARSER_VERSION.encode())
+        return h.hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, f"{key}.json.gz")
+
+    def contains(self, key):
+        if not self.path:
+            return False
+        try:
+            return time.time() - os.path.getmtime(self._file(key)) <= self.ttl
+        except OSError:
+            return False
+
+    def get(self, key):
+        """The cached transaction list, or None."""
+        if not self.path:
+            return None
+        file_path = self._file(key)
+        try:
+            if time.time() - os.path.getmtime(file_path) > self.ttl:
+                os.remove(file_path)
+                raise FileNotFoundError(file_path)
+            with gzip.open(file_path, "rt", encoding="utf-8") as f:
+                rows = json.load(f)
+            # Reads refresh the entry: mtime doubles as the LRU clock.
+            os.utime(file_path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return rows
+
+    def put(self, key, rows):
+        if not self.path:
+            return
+        file_path = self._file(key)
+        # Write to a temp file and rename, so a concurrent reader never sees a torn file.
+        tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False)
+        os.replace(tmp_path, file_path)
+        self.evict()
+
+    def evict(self):
+        now = time.time()
+        entries = []
+        total = 0
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith(".json.gz"):
+                continue
+            stat = entry.stat()
+            if now - stat.st_mtime > self.ttl:
+                self._remove(entry.path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        # Oldest first until the directory fits again.
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # another worker got there first
+
+    def stats(self):
+        files = [e for e in os.scandir(self.path) if e.name.endswith(".json.gz")] if self.path else []
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(files),
+                "size_mb": round(sum(e.stat().st_size for e in files) / 1e6, 2),
+                "max_size_mb": round(self.max_bytes / 1e6, 2),
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "path": self.path,
+                "parser_version": PARSER_VERSION,
+            }
+
+
+class SeenReferences:
+    """References (UTRs, else transaction ids) already returned to each user, on local disk.
+
+    One JSON file per user, named by a hash of the userId, mapping each
+    reference to when it was last returned. Entries older than ttl seconds are
+    ignored and dropped on the next write.
+    """
+
+    def __init__(self, path, ttl=180 * 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    def _file(self, user_id):
+        return os.path.join(self.path, hashlib.blake2b(user_id.encode(), digest_size=16).hexdigest() + ".json")
+
+    def _load(self, user_id):
+        try:
+            with open(self._file(user_id), encoding="utf-8") as f:
+                seen = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        now = time.time()
+        return {ref: at for ref, at in seen.items() if now - at <= self.ttl}
+
+    def get(self, user_id):
+        """The user's unexpired references, as a set."""
+        if not self.path or not user_id:
+            return set()
+        return set(self._load(user_id))
+
+    def add(self, user_id, references):
+        if not self.path or not user_id or not references:
+            return
+        now = time.time()
+        with self._lock:
+            seen = self._load(user_id)
+            seen.update((ref, now) for ref in references)
+            file_path = self._file(user_id)
+            tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(seen, f)
+            os.replace(tmp_path, file_path)
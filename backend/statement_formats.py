@@ -0,0 +1,145 @@
+import re
+import json
+import hashlib
+from datetime import datetime
+from functools import lru_cache
+
+# ----- Statement Formats -----
+# Each format is plain data: how to recognise the statement from its first
+# page, and one regex per line of a transaction block. Named groups fill the
+# transaction: date, time, description, type, amount, transactionId, utr.
+# Only the first line's pattern is required; a later line that doesn't match
+# leaves its fields blank. Adding a bank means adding an entry here.
+STATEMENT_FORMATS = [
+    {
+        # PhonePe-style UPI statement, 4 lines per transaction:
+        #   Apr 09, 2025 Paid to Swiggy DEBIT ₹250.50
+        #   10:15 am Transaction ID T2504091015123456
+        #   UTR No. 509912345678
+        #   Paid by XXXXXX1234
+        "name": "upi_4line",
+        "detect": r"Transaction ID.*\n\s*UTR No\.",
+        # Cheap substring test before any regex runs on a line.
+        "markers": ["DEBIT", "CREDIT"],
+        "lines": [
+            # pdfplumber sometimes drops the ₹ glyph; a missing amount parses as 0.
+            r"(?P<date>\w{3} \d{1,2}, \d{4})\s+(?:Paid to|Received from)\s+(?P<description>.*?)\s+"
+            r"(?P<type>DEBIT|CREDIT)(?:\s*₹?\s*(?P<amount>[\d,]*\.?\d+))?.*$",
+            r"(?P<time>\S+)(?:.*?Transaction ID\s*(?P<transactionId>.*?)\s*$)?",
+            r".*?UTR No\.\s*(?P<utr>.*?)\s*$",
+            r".*",
+        ],
+        "date_format": "%b %d, %Y",
+        "time_format": "%H:%M",
+    },
+    {
+        # One line per transaction, as in account statements that list UPI
+        # narrations ("UPI/DR/<UTR>/<payee>/...") with a Dr/Cr amount:
+        #   09/04/2025 UPI/DR/509912345678/SWIGGY/YESB/swiggy@ybl 250.50 Dr
+        "name": "upi_ledger",
+        "detect": r"\d{2}/\d{2}/\d{4} UPI/(?:DR|CR)/",
+        "markers": ["UPI/"],
+        "lines": [
+            # The UTR is the only reference these statements carry; it doubles as the transactionId.
+            r"(?P<date>\d{2}/\d{2}/\d{4})\s+UPI/(?:DR|CR)/(?P<utr>\d+)/(?P<description>[^/]+)\S*\s+"
+            r"(?P<amount>[\d,]*\.?\d+)\s+(?P<type>Dr|Cr)\s*$",
+        ],
+        "date_format": "%d/%m/%Y",
+        "types": {"Dr": "DEBIT", "Cr": "CREDIT"},
+    },
+]
+
+DEFAULT_FORMAT = "upi_4line"
+
+# Bump when parsing code changes output; format edits change the hash by themselves.
+PARSER_REVISION = 2
+PARSER_VERSION = f"{PARSER_REVISION}-" + hashlib.sha1(
+    json.dumps(STATEMENT_FORMATS, sort_keys=True).encode()).hexdigest()[:12]
+
+
+# ----- Fast Date Parsing -----
+# Statements repeat the same few dates and times on every row; strptime runs
+# once per distinct string.
+@lru_cache(maxsize=4096)
+def parse_date(text, fmt):
+    try:
+        return datetime.strptime(text, fmt).date()
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=2048)
+def parse_time(text, fmt):
+    try:
+        return datetime.strptime(text, fmt).time()
+    except ValueError:
+        return None
+
+
+def parse_amount(text):
+    try:
+        return float(text.replace(",", ""))
+    except ValueError:
+        return 0
+
+
+class StatementFormat:
+    """A STATEMENT_FORMATS entry with its regexes compiled."""
+
+    def __init__(self, spec):
+        self.name = spec["name"]
+        self.detect_re = re.compile(spec["detect"])
+        self.markers = tuple(spec.get("markers", ()))
+        self.line_res = [re.compile(pattern) for pattern in spec["lines"]]
+        self.block_size = len(self.line_res)
+        self.date_format = spec["date_format"]
+        self.time_format = spec.get("time_format")
+        self.types = spec.get("types", {})
+
+    def detects(self, text):
+        return self.detect_re.search(text) is not None
+
+    def match_start(self, line):
+        # Match object when line opens a transaction block, else None.
+        if self.markers and not any(marker in line for marker in self.markers):
+            return None
+        return self.line_res[0].match(line)
+
+    def parse_block(self, start, rest, userId=""):
+        # start: match of the block's first line; rest: the following lines (may be short).
+        fields = start.groupdict()
+        for pattern, line in zip(self.line_res[1:], rest):
+            m = pattern.match(line)
+            if m:
+                fields.update((k, v) for k, v in m.groupdict().items() if v is not None)
+
+        createdAt = date_only = ""
+        day = parse_date(fields["date"], self.date_format)
+        moment = parse_time(fields.get("time") or "00:00", self.time_format or "%H:%M")
+        if day is not None and moment is not None:
+            createdAt = datetime.combine(day, moment).isoformat() + "Z"
+            date_only = day.isoformat() + "T00:00:00.000Z"
+
+        return {
+            "amount": parse_amount(fields.get("amount") or ""),
+            "createdAt": createdAt,
+            "date": date_only,
+            "description": fields["description"].strip(),
+            "transactionId": fields.get("transactionId") or fields.get("utr") or "",
+            "transactionType": self.types.get(fields["type"], fields["type"]),
+            "userId": userId,
+            # The bank's reference, the same in every statement that lists the payment.
+            "utr": fields.get("utr") or "",
+        }
+
+
+FORMATS = [StatementFormat(spec) for spec in STATEMENT_FORMATS]
+FORMATS_BY_NAME = {fmt.name: fmt for fmt in FORMATS}
+
+
+def detect_format(first_page_text):
+    """The format whose detect pattern matches the first page (default: upi_4line)."""
+    for fmt in FORMATS:
+        if fmt.detects(first_page_text):
+            return fmt
+    return FORMATS_BY_NAME[DEFAULT_FORMAT]
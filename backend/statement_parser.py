@@ -0,0 +1,156 @@
+import io
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfplumber
+
+from statement_formats import FORMATS_BY_NAME, detect_format
+
+# Processes used to run page.extract_text(); 1 extracts in the calling process.
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", os.cpu_count() or 1))
+# Pages each worker task extracts (the PDF is opened once per task).
+PDF_PAGES_PER_TASK = int(os.environ.get("PDF_PAGES_PER_TASK", 8))
+
+_pool = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        # spawn: workers import only this module, not the web app that created them.
+        _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+# ----- Text Extraction -----
+def open_pdf(source):
+    # source: a file path or the PDF's bytes (copied into each pool task, so
+    # only for small files; larger ones are passed by path).
+    return pdfplumber.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+
+
+def extract_page_range(source, start, stop):
+    # One list of text lines per page in [start, stop).
+    pages = []
+    with open_pdf(source) as pdf:
+        for page in pdf.pages[start:stop]:
+            text = page.extract_text()
+            pages.append(text.split("\n") if text else [])
+            # Drop the page's parsed layout objects; only its text is kept.
+            page.close()
+    return pages
+
+
+def page_count(source):
+    with open_pdf(source) as pdf:
+        return len(pdf.pages)
+
+
+def iter_page_lines(source, workers=None):
+    """Yield each page's text lines in document order, pages extracted in worker processes."""
+    workers = PDF_WORKERS if workers is None else workers
+    if workers <= 1:
+        with open_pdf(source) as pdf:
+            for page in pdf.pages:
+                text = page.extract_text()
+                yield text.split("\n") if text else []
+                page.close()
+        return
+
+    # Even a short statement is a single pool task, so no extraction ever runs
+    # in (and holds the GIL of) the web server process.
+    pages = page_count(source)
+    # Page ranges are consumed in submission order; at most two per worker are
+    # in flight, so a long statement never sits in memory all at once.
+    pool = get_pool()
+    in_flight = deque()
+    try:
+        for start in range(0, pages, PDF_PAGES_PER_TASK):
+            in_flight.append(pool.submit(extract_page_range, source, start, min(start + PDF_PAGES_PER_TASK, pages)))
+            if len(in_flight) >= 2 * workers:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+    finally:
+        # The consumer stopped early (e.g. a streaming client went away).
+        for future in in_flight:
+            future.cancel()
+
+
+# ----- Transaction Parsing -----
+def iter_transactions(pages, userId="", fmt=None):
+    """Yield transactions from an iterable of per-page line lists.
+
+    The statement format is detected from the first page unless given. A
+    block cut off by the end of a page is carried over and completed with the
+    next page's lines.
+    """
+    if isinstance(fmt, str):
+        fmt = FORMATS_BY_NAME[fmt]
+    carry = []
+    for page_lines in pages:
+        if fmt is None:
+            if not page_lines:
+                continue
+            fmt = detect_format("\n".join(page_lines))
+        lines = carry + page_lines
+        carry = []
+        size = fmt.block_size
+        i = 0
+        while i < len(lines):
+            start = fmt.match_start(lines[i])
+            if start is None:
+                i += 1
+            elif i + size > len(lines):
+                # Rest of the block is on the next page.
+                carry = lines[i:]
+                break
+            else:
+                yield fmt.parse_block(start, lines[i + 1:i + size], userId=userId)
+                # Skip the lines that we processed as part of this transaction block.
+                i += size
+
+    # The document's last block may be short; its missing lines are blank.
+    if carry:
+        yield fmt.parse_block(fmt.match_start(carry[0]), carry[1:], userId=userId)
+
+
+def parse_lines(lines, userId="", fmt=None):
+    return list(iter_transactions([lines], userId=userId, fmt=fmt))
+
+
+def pdf_to_json(source, userId=""):
+    return list(iter_transactions(iter_page_lines(source), userId=userId))
+
+
+if __name__ == "__main__":
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Parse a statement PDF and report extraction and parsing speed.")
+    parser.add_argument("pdf")
+    parser.add_argument("--format", choices=sorted(FORMATS_BY_NAME), help="skip format detection")
+    parser.add_argument("--repeat", type=int, default=20, help="parsing passes over the extracted lines")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    pages = list(iter_page_lines(args.pdf))
+    extract_s = time.perf_counter() - start
+    fmt = FORMATS_BY_NAME[args.format] if args.format else detect_format("\n".join(next((p for p in pages if p), [])))
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        rows = list(iter_transactions(pages, fmt=fmt))
+    parse_s = (time.perf_counter() - start) / args.repeat
+    print(f"📄 {args.pdf}: {len(pages)} pages, format {fmt.name}, {len(rows)} transactions")
+    print(f"⏱️ extraction {extract_s:.2f}s ({len(pages) / extract_s:.1f} pages/s), "
+          f"parsing {len(rows) / max(parse_s, 1e-9):,.0f} rows/s")
@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import time
+import platform
+import threading
+
+# Shared by microbench.py and loadtest.py: repo paths, timing, RSS sampling
+# and the stored baselines regressions are checked against.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_TRAINING_DIR = os.path.join(REPO_ROOT, "model-training")
+BACKEND_DIR = os.path.join(REPO_ROOT, "backend")
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+# A result this much worse than its baseline is reported as a regression.
+DEFAULT_TOLERANCE = float(os.environ.get("BENCH_TOLERANCE", "0.25"))
+
+# Both services are flat script directories, not packages.
+for _path in (MODEL_TRAINING_DIR, BACKEND_DIR):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def time_calls(fn, min_time=1.0, min_repeat=3, max_repeat=1000):
+    """Per-call seconds of fn(), repeated until min_time has passed (after one warm-up call)."""
+    fn()
+    times = []
+    started = time.perf_counter()
+    while len(times) < min_repeat or (time.perf_counter() - started < min_time and len(times) < max_repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+# ----- Memory -----
+def _children(pid):
+    # Scans /proc instead of needing psutil; gunicorn workers are children of the master.
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; ppid is the 2nd field after it.
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def tree_rss_mb(pid):
+    """RSS of a process and all its descendants (shared pages counted once per process)."""
+    total, stack = 0.0, [pid]
+    while stack:
+        current = stack.pop()
+        total += rss_mb(current)
+        stack.extend(_children(current))
+    return total
+
+
+class RssSampler:
+    """Samples the RSS of process trees in a background thread and keeps the peak."""
+
+    def __init__(self, pids, interval=0.1):
+        self.pids = list(pids)
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, sum(tree_rss_mb(pid) for pid in self.pids))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+# ----- Baselines -----
+def machine_info():
+    return {"cpus": os.cpu_count(), "python": platform.python_version(), "machine": platform.machine()}
+
+
+def baseline_path(suite):
+    return os.path.join(BASELINE_DIR, f"{suite}.json")
+
+
+def load_baseline(suite):
+    path = baseline_path(suite)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(suite, results):
+    # Merged into the stored results, so a partial run (--only) updates just its benchmarks.
+    baseline = load_baseline(suite)
+    if baseline and baseline["machine"] == machine_info():
+        results = {**baseline["results"], **results}
+    results = {name: {metric: round(value, 3) for metric, value in metrics.items()} for name, metrics in results.items()}
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    with open(baseline_path(suite), "w") as f:
+        json.dump({"machine": machine_info(), "results": results}, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"💾 Baseline saved to {baseline_path(suite)}")
+
+
+def higher_is_better(metric):
+    return metric.endswith("_per_s")
+
+
+def compare_to_baseline(suite, results, tolerance=DEFAULT_TOLERANCE):
+    """Print each metric against the stored baseline; returns the regressions found."""
+    baseline = load_baseline(suite)
+    if baseline is None:
+        print(f"⚠️ No baseline at {baseline_path(suite)}; run with --save-baseline to record one.")
+        return []
+    if baseline["machine"] != machine_info():
+        print(f"⚠️ Baseline was recorded on {baseline['machine']}, this is {machine_info()}; "
+              f"differences may be the machine, not the code.")
+
+    regressions = []
+    print(f"{'benchmark':<34} {'metric':<14} {'baseline':>10} {'now':>10} {'change':>8}")
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline["results"].get(name, {}).get(metric)
+            if not old:
+                continue
+            change = value / old - 1
+            worse = -change if higher_is_better(metric) else change
+            flag = "  ❌" if worse > tolerance else ""
+            print(f"{name:<34} {metric:<14} {old:>10.2f} {value:>10.2f} {change*100:>+7.1f}%{flag}")
+            if worse > tolerance:
+                regressions.append((name, metric, old, value))
+    if regressions:
+        print(f"❌ {len(regressions)} metric(s) regressed by more than {tolerance*100:.0f}%")
+    else:
+        print(f"✅ No regressions beyond {tolerance*100:.0f}%")
+    return regressions
+
+
+def finish(suite, results, save=False, tolerance=DEFAULT_TOLERANCE):
+    """Save or compare against the baseline; the exit status is non-zero on regressions."""
+    if save:
+        save_baseline(suite, results)
+        return 0
+    return 1 if compare_to_baseline(suite, results, tolerance) else 0
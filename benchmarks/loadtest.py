@@ -0,0 +1,167 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+from bench_utils import MODEL_TRAINING_DIR, BACKEND_DIR, DEFAULT_TOLERANCE, RssSampler, percentile, finish
+
+# Load scenarios against local instances of both services, started by this
+# script and stopped when it exits (no network access needed):
+#   python loadtest.py                          # compare with baselines/load.json
+#   python loadtest.py --only predict --save-baseline
+# Each scenario reports latency percentiles, throughput and the peak RSS of the
+# server process tree (gunicorn master + workers, uvicorn + extraction pool).
+
+MODEL_PORT = int(os.environ.get("BENCH_MODEL_PORT", "18080"))
+BACKEND_PORT = int(os.environ.get("BENCH_BACKEND_PORT", "18000"))
+STARTUP_TIMEOUT_S = 180
+
+# name: (service, requests, concurrency, rows per request)
+SCENARIOS = {
+    "predict": ("model", 400, 8, 1),
+    "bulk_predict": ("model", 20, 2, 256),
+    "extract_text": ("backend", 12, 4, 130),
+    "extract_and_categorize": ("backend", 8, 2, 130),
+}
+
+
+# ----- Services -----
+def start_service(service, model_root):
+    env = dict(os.environ)
+    if service == "model":
+        env["PORT"] = str(MODEL_PORT)
+        cmd = [sys.executable, "-m", "gunicorn", "-c", os.path.join(MODEL_TRAINING_DIR, "gunicorn.conf.py"),
+               "server:app"]
+        # server.py reads model/ relative to its working directory.
+        cwd, url = model_root, f"http://127.0.0.1:{MODEL_PORT}"
+        env["PYTHONPATH"] = os.pathsep.join([MODEL_TRAINING_DIR, env.get("PYTHONPATH", "")])
+    else:
+        # No statement cache: every upload is parsed, which is what is being measured.
+        env.update(STATEMENT_CACHE_DIR="", CATEGORIZER_URL=f"http://127.0.0.1:{MODEL_PORT}")
+        cmd = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(BACKEND_PORT), "--log-level", "warning"]
+        cwd, url = BACKEND_DIR, f"http://127.0.0.1:{BACKEND_PORT}"
+    process = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_until_up(url, process)
+    return process, url
+
+
+def wait_until_up(url, process):
+    deadline = time.monotonic() + STARTUP_TIMEOUT_S
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"❌ Service for {url} exited with status {process.returncode}")
+        try:
+            if httpx.get(f"{url}/", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise SystemExit(f"❌ {url} did not come up within {STARTUP_TIMEOUT_S}s")
+
+
+def stop_service(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+# ----- Requests -----
+def request_factory(scenario, fixtures):
+    """A function client -> awaitable response for one request of the scenario."""
+    rows, pdf_bytes = fixtures["rows"], fixtures["pdf"]
+    # Every request sends rows not sent before, so the embedding cache doesn't answer them.
+    counter = iter(range(10 ** 9))
+    if scenario == "predict":
+        return lambda client, url: client.post(f"{url}/predict", json=rows[next(counter) % len(rows)])
+    if scenario == "bulk_predict":
+        size = SCENARIOS[scenario][3]
+
+        def send(client, url):
+            start = next(counter) * size % len(rows)
+            return client.post(f"{url}/bulk_predict", json={"transactions": rows[start:start + size]})
+        return send
+    path = "/extract-text" if scenario == "extract_text" else "/extract-and-categorize"
+    return lambda client, url: client.post(f"{url}{path}", data={"userId": "bench"},
+                                           files={"file": ("statement.pdf", pdf_bytes, "application/pdf")})
+
+
+async def run_load(send, url, total, concurrency):
+    latencies, errors = [], 0
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(client):
+        nonlocal errors
+        async with slots:
+            start = time.perf_counter()
+            response = await send(client, url)
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code != 200
+
+    async with httpx.AsyncClient(timeout=600) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(client) for _ in range(total)))
+        return latencies, errors, time.perf_counter() - started
+
+
+def run_scenario(scenario, url, pids, fixtures):
+    _, total, concurrency, rows = SCENARIOS[scenario]
+    send = request_factory(scenario, fixtures)
+    asyncio.run(run_load(send, url, concurrency, concurrency))  # warm-up, not measured
+    with RssSampler(pids) as sampler:
+        latencies, errors, elapsed = asyncio.run(run_load(send, url, total, concurrency))
+    ms = [s * 1000 for s in latencies]
+    result = {"p50_ms": percentile(ms, 50), "p95_ms": percentile(ms, 95), "p99_ms": percentile(ms, 99),
+              "rows_per_s": total * rows / elapsed, "peak_rss_mb": sampler.peak_mb}
+    print(f"{scenario:<24} n={total:<4} c={concurrency:<3} p50={result['p50_ms']:8.1f}ms  "
+          f"p95={result['p95_ms']:8.1f}ms  p99={result['p99_ms']:8.1f}ms  {total / elapsed:7.1f} req/s  "
+          f"{result['rows_per_s']:8.0f} rows/s  peak RSS {sampler.peak_mb:6.0f} MB"
+          + (f"  ❌ {errors} errors" if errors else ""))
+    return result
+
+
+def make_fixtures(tmp):
+    from generate_transactions import generate, write_statement_pdf
+
+    rows = next(generate(20000, seed=11)).to_dict("records")
+    pdf_path = os.path.join(tmp, "statement.pdf")
+    write_statement_pdf(generate(SCENARIOS["extract_text"][3], seed=12), pdf_path)
+    with open(pdf_path, "rb") as f:
+        return {"rows": rows, "pdf": f.read()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test local instances of the model server and backend.")
+    parser.add_argument("--only", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--model-root", default=MODEL_TRAINING_DIR,
+                        help="directory holding the model/ the model server loads")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to baselines/load.json")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="fractional slowdown flagged as a regression")
+    args = parser.parse_args()
+
+    # The backend's categorize scenario calls the model server, so it is always started.
+    need_backend = any(SCENARIOS[s][0] == "backend" for s in args.only)
+    results, services = {}, {}
+    with tempfile.TemporaryDirectory() as tmp:
+        fixtures = make_fixtures(tmp)
+        try:
+            services["model"] = start_service("model", args.model_root)
+            if need_backend:
+                services["backend"] = start_service("backend", args.model_root)
+            for scenario in args.only:
+                process, url = services[SCENARIOS[scenario][0]]
+                # extract_and_categorize also loads the model server.
+                pids = [p.pid for p, _ in services.values()] if scenario == "extract_and_categorize" else [process.pid]
+                results[scenario] = run_scenario(scenario, url, pids, fixtures)
+        finally:
+            for process, _ in services.values():
+                stop_service(process)
+    raise SystemExit(finish("load", results, save=args.save_baseline, tolerance=args.tolerance))
@@ -0,0 +1,134 @@
+import os
+import argparse
+import tempfile
+
+import numpy as np
+
+from bench_utils import MODEL_TRAINING_DIR, DEFAULT_TOLERANCE, percentile, time_calls, finish
+
+# Microbenchmarks of the hot paths, in-process and offline:
+#   python microbench.py                   # compare with baselines/micro.json
+#   python microbench.py --save-baseline   # record a new baseline
+# Inputs are generated with model-training/generate_transactions.py, so every run sees the same data.
+
+NORMALIZE_SIZES = [1000, 10000, 100000]
+ENCODE_SIZES = [1, 32, 256]
+PREDICT_SIZES = [1, 32, 1024]
+PDF_PAGES = [1, 10, 50]
+ROWS_PER_PAGE = 13  # upi_4line transactions generate_transactions.py fits on a page
+GROUPS = ["normalize", "encode", "predict_proba", "pdf_to_json"]
+
+
+def record(results, name, times, rows):
+    p50 = percentile(times, 50)
+    # p95 is printed but not compared: on a shared machine it is mostly noise.
+    results[name] = {"p50_ms": p50 * 1000, "rows_per_s": rows / p50}
+    print(f"{name:<34} n={len(times):<5} p50={p50*1000:9.3f}ms  p95={percentile(times, 95)*1000:9.3f}ms  "
+          f"{rows / p50:12,.0f} rows/s")
+
+
+def transactions(rows, seed=7):
+    from generate_transactions import generate
+    import pandas as pd
+
+    return pd.concat(list(generate(rows, seed=seed)), ignore_index=True)
+
+
+# ----- Benchmarks -----
+def bench_normalize(results, min_time):
+    from text_prep import COLUMN_ALIASES, build_input_text, build_input_texts
+
+    df = transactions(max(NORMALIZE_SIZES)).rename(columns=COLUMN_ALIASES)
+    for n in NORMALIZE_SIZES:
+        part = df.iloc[:n]
+        record(results, f"normalize_batch[n={n}]", time_calls(lambda: build_input_texts(part), min_time), n)
+    rows = list(df.iloc[:1000][["Description", "Type", "Amount"]].itertuples(index=False))
+    record(results, "normalize_single[n=1000]",
+           time_calls(lambda: [build_input_text(*row) for row in rows], min_time), len(rows))
+
+
+def load_embedder(model_root):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(os.path.join(model_root, "model", "embedder"))
+
+
+def model_texts(n):
+    from text_prep import COLUMN_ALIASES, build_input_texts
+    return build_input_texts(transactions(n).rename(columns=COLUMN_ALIASES))
+
+
+def bench_encode(results, min_time, model_root):
+    embedder = load_embedder(model_root)
+    texts = model_texts(max(ENCODE_SIZES))
+    for n in ENCODE_SIZES:
+        batch = texts[:n]
+        record(results, f"encode[n={n}]", time_calls(lambda: embedder.encode(batch), min_time), n)
+
+
+def bench_predict_proba(results, min_time, model_root):
+    import joblib
+    from distill import DistilledClassifier
+
+    classifiers = {}
+    distilled_path = os.path.join(model_root, "model", "distilled.npz")
+    if os.path.exists(distilled_path):
+        classifiers["distilled"] = DistilledClassifier.load(distilled_path)
+    classifiers["ensemble"] = joblib.load(os.path.join(model_root, "model", "classifier.pkl"), mmap_mode="r")
+
+    # Real embeddings, tiled up to the largest batch.
+    X = load_embedder(model_root).encode(model_texts(256))
+    X = np.tile(X, (max(PREDICT_SIZES) // len(X) + 1, 1))
+    for name, clf in classifiers.items():
+        for n in PREDICT_SIZES:
+            batch = X[:n]
+            record(results, f"predict_proba[{name},n={n}]", time_calls(lambda: clf.predict_proba(batch), min_time), n)
+
+    # The cascade's first tier works on the description text, not on embeddings.
+    ngram_path = os.path.join(model_root, "model", "ngram.npz")
+    if os.path.exists(ngram_path):
+        from ngram_classifier import NgramClassifier, ngram_texts
+        from text_prep import COLUMN_ALIASES
+
+        ngram = NgramClassifier.load(ngram_path)
+        texts = ngram_texts(transactions(max(PREDICT_SIZES)).rename(columns=COLUMN_ALIASES))
+        for n in PREDICT_SIZES:
+            batch = texts[:n]
+            record(results, f"predict_proba[ngram,n={n}]", time_calls(lambda: ngram.predict_proba(batch), min_time), n)
+
+
+def bench_pdf_to_json(results, min_time):
+    from generate_transactions import generate, write_statement_pdf
+    from statement_parser import pdf_to_json, shutdown_pool
+
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            for pages in PDF_PAGES:
+                path = os.path.join(tmp, f"statement-{pages}.pdf")
+                rows = write_statement_pdf(generate(pages * ROWS_PER_PAGE, seed=pages), path)
+                record(results, f"pdf_to_json[pages={pages}]", time_calls(lambda: pdf_to_json(path, "bench"), min_time),
+                       rows)
+        finally:
+            shutdown_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmarks for normalization, encoding, classification and parsing.")
+    parser.add_argument("--only", nargs="+", choices=GROUPS, default=GROUPS, help="benchmark groups to run")
+    parser.add_argument("--model-root", default=MODEL_TRAINING_DIR,
+                        help="directory holding model/embedder, model/classifier.pkl (and model/distilled.npz)")
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds each benchmark repeats for")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to baselines/micro.json")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="fractional slowdown flagged as a regression")
+    args = parser.parse_args()
+
+    results = {}
+    if "normalize" in args.only:
+        bench_normalize(results, args.min_time)
+    if "encode" in args.only:
+        bench_encode(results, args.min_time, args.model_root)
+    if "predict_proba" in args.only:
+        bench_predict_proba(results, args.min_time, args.model_root)
+    if "pdf_to_json" in args.only:
+        bench_pdf_to_json(results, args.min_time)
+    raise SystemExit(finish("micro", results, save=args.save_baseline, tolerance=args.tolerance))
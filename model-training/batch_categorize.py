@@ -0,0 +1,323 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import multiprocessing
+from collections import Counter, deque
+
+import numpy as np
+
+from cascade import classify, ngram_results, run_cascade
+from ngram_classifier import NGRAM_MIN_CONFIDENCE, ngram_text
+from text_prep import COLUMN_ALIASES, build_input_text
+from generate_transactions import output_format, write_table
+
+# Offline categorization of large transaction files with the trained models,
+# no HTTP server involved:
+#   python batch_categorize.py history.csv history-categorized.csv --workers 4
+# The input is read CHUNK_SIZE rows at a time and chunks are categorized in
+# worker processes, each writing its result to <output>.parts/part-NNNNNN.
+# Re-running the same command after an interruption skips the chunks whose
+# part already exists. When every chunk is done the parts are joined into
+# <output> in input order.
+
+CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", "50000"))
+PART_EXTENSIONS = {"csv": "csv", "ndjson": "ndjson", "parquet": "parquet"}
+# Added to every row; an input column of the same name is only replaced with --overwrite.
+OUTPUT_COLUMNS = ("category", "confidence", "source")
+
+
+# ----- Input -----
+def read_chunks(path, fmt, chunksize):
+    """DataFrames of up to chunksize rows, read lazily from CSV, NDJSON or Parquet."""
+    import pandas as pd
+
+    if fmt == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("❌ Parquet input needs pyarrow (pip install pyarrow).")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    elif fmt == "ndjson":
+        yield from pd.read_json(path, lines=True, chunksize=chunksize, dtype=False)
+    else:
+        # Read as text so IDs and amounts are written back exactly as they came in.
+        yield from pd.read_csv(path, chunksize=chunksize, dtype=str, keep_default_na=False)
+
+
+def check_output_columns(path, fmt, overwrite):
+    # Only the first row is read, before any model is loaded.
+    columns = next(read_chunks(path, fmt, 1)).columns
+    clashing = [column for column in OUTPUT_COLUMNS if column in columns]
+    if clashing and not overwrite:
+        raise SystemExit(f"❌ The input already has a {', '.join(clashing)} column; "
+                         f"use --overwrite to replace it with the predictions.")
+
+
+def find_column(df, canonical):
+    # Accepts both the app's export names (description, ...) and the training names (Description, ...).
+    for name, alias in COLUMN_ALIASES.items():
+        if alias == canonical and name in df.columns:
+            return name
+    return canonical if canonical in df.columns else None
+
+
+# ----- Models (loaded once per worker) -----
+_models = None
+
+
+def model_paths(model_dir, classifier, cascade):
+    """{role: path} of the model files a run loads; the cascade tiers only if they exist."""
+    paths = {"embedder": os.path.join(model_dir, "embedder")}
+    distilled_path = os.path.join(model_dir, "distilled.npz")
+    if classifier == "distilled" and os.path.exists(distilled_path):
+        paths["distilled"] = distilled_path
+    else:
+        paths["ensemble"] = os.path.join(model_dir, "classifier.pkl")
+    if cascade:
+        for role, name in (("merchant_index", "merchant_index.json"), ("ngram", "ngram.npz")):
+            if os.path.exists(os.path.join(model_dir, name)):
+                paths[role] = os.path.join(model_dir, name)
+    return paths
+
+
+def load_models(model_dir, classifier, cascade, ngram_min_confidence, threads):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    paths = model_paths(model_dir, classifier, cascade)
+    models = {"embedder": SentenceTransformer(paths["embedder"]),
+              "merchant_index": None, "ngram": None, "ngram_min_confidence": ngram_min_confidence}
+    if "distilled" in paths:
+        from distill import DistilledClassifier
+        models["classifier"] = DistilledClassifier.load(paths["distilled"])
+    else:
+        import joblib
+        models["classifier"] = joblib.load(paths["ensemble"], mmap_mode="r")
+    if "merchant_index" in paths:
+        from merchant_index import MerchantIndex
+        models["merchant_index"] = MerchantIndex.load(paths["merchant_index"])
+    if "ngram" in paths:
+        from ngram_classifier import NgramClassifier
+        models["ngram"] = NgramClassifier.load(paths["ngram"])
+    return models
+
+
+def _init_worker(*model_args):
+    global _models
+    _models = load_models(*model_args)
+
+
+def categorize_frame(df, models):
+    """(category, confidence, source) lists for a chunk: the server's cascade, in batch."""
+    desc_col, type_col, amount_col = (find_column(df, c) for c in ("Description", "Type", "Amount"))
+    if desc_col is None:
+        raise ValueError("Input has no description column")
+    n = len(df)
+    descriptions = df[desc_col].fillna("").astype(str).tolist()
+    types = df[type_col].fillna("Debit").astype(str).tolist() if type_col else ["Debit"] * n
+    amounts = df[amount_col].tolist() if amount_col else [None] * n
+
+    def merchant_tier(rows):
+        return [models["merchant_index"].lookup(descriptions[i]) for i in rows]
+
+    def ngram_tier(rows):
+        ngram = models["ngram"]
+        proba = ngram.predict_proba([ngram_text(descriptions[i], types[i]) for i in rows])
+        return ngram_results(proba, ngram.classes_, models["ngram_min_confidence"])
+
+    def model_tier(rows):
+        # Historical data repeats itself: each distinct input text is embedded once per chunk.
+        texts = [build_input_text(descriptions[i], types[i], amounts[i]) for i in rows]
+        unique, inverse = np.unique(texts, return_inverse=True)
+        embeddings = models["embedder"].encode(unique.tolist(), batch_size=64)[inverse.ravel()]
+        clf = models["classifier"]
+        categories, confidences = classify(clf.predict_proba(embeddings), clf.classes_)
+        return [(category, confidence, "model") for category, confidence in zip(categories, confidences)]
+
+    # Same tiers as server.py; rows are indices into the chunk.
+    results = [("Other", 0.0, "empty") if not d.strip() else None for d in descriptions]
+    rows = [i for i, result in enumerate(results) if result is None]
+    answers = run_cascade(rows, merchant_tier if models["merchant_index"] is not None else None,
+                          ngram_tier if models["ngram"] is not None else None, model_tier)
+    for i, result in zip(rows, answers):
+        results[i] = result
+    return results
+
+
+def part_path(parts_dir, chunk_no, fmt):
+    return os.path.join(parts_dir, f"part-{chunk_no:06d}.{PART_EXTENSIONS[fmt]}")
+
+
+def _categorize_chunk(args):
+    chunk_no, df, parts_dir, fmt = args
+    started = time.perf_counter()
+    results = categorize_frame(df, _models)
+    df = df.assign(category=[r[0] for r in results], confidence=[round(r[1], 3) for r in results],
+                   source=[r[2] for r in results])
+    # Written beside the part and renamed: a part that exists is always complete.
+    path = part_path(parts_dir, chunk_no, fmt)
+    tmp_path = os.path.join(parts_dir, f"tmp-{os.path.basename(path)}")
+    write_table([df], tmp_path, fmt)
+    os.replace(tmp_path, path)
+    tiers = Counter("merchant" if r[2].startswith("merchant") else r[2] for r in results)
+    return chunk_no, len(df), dict(tiers), time.perf_counter() - started
+
+
+# ----- Resume bookkeeping -----
+def file_identity(path):
+    # [size, mtime] of a file, or of every file under a directory (the embedder).
+    if not os.path.isdir(path):
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime]
+    identity = {}
+    for root, _, files in sorted(os.walk(path)):
+        for name in sorted(files):
+            full_path = os.path.join(root, name)
+            identity[os.path.relpath(full_path, path)] = file_identity(full_path)
+    return identity
+
+
+def run_manifest(input_path, in_fmt, out_fmt, chunk_size, model_dir, classifier, cascade, ngram_min_confidence,
+                 overwrite):
+    stat = os.stat(input_path)
+    # Parts written with other models or another n-gram gate would mix two sets of predictions.
+    models = {role: {"path": os.path.abspath(path), "files": file_identity(path)}
+              for role, path in model_paths(model_dir, classifier, cascade).items()}
+    return {"input": os.path.abspath(input_path), "input_size": stat.st_size, "input_mtime": stat.st_mtime,
+            "input_format": in_fmt, "output_format": out_fmt, "chunk_size": chunk_size,
+            "classifier": classifier, "cascade": cascade, "ngram_min_confidence": ngram_min_confidence,
+            "overwrite": overwrite, "models": models}
+
+
+def prepare_parts_dir(parts_dir, manifest, restart=False):
+    """Set of chunk numbers already written by an earlier run of the same job."""
+    manifest_path = os.path.join(parts_dir, "manifest.json")
+    if restart and os.path.isdir(parts_dir):
+        shutil.rmtree(parts_dir)
+    os.makedirs(parts_dir, exist_ok=True)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+        if previous != manifest:
+            changed = sorted(key for key in set(previous) | set(manifest) if previous.get(key) != manifest.get(key))
+            raise SystemExit(f"❌ {parts_dir} belongs to a different run ({', '.join(changed)} changed). "
+                             f"Use --restart to discard it.")
+    else:
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+    return {int(name[len("part-"):len("part-") + 6]) for name in os.listdir(parts_dir) if name.startswith("part-")}
+
+
+def join_parts(parts_dir, chunks, output, fmt):
+    """Concatenate the parts into output in chunk order, then remove them."""
+    paths = [part_path(parts_dir, chunk_no, fmt) for chunk_no in range(chunks)]
+    tmp_output = f"{output}.tmp"
+    if fmt == "parquet":
+        import pandas as pd
+        write_table((pd.read_parquet(path) for path in paths), tmp_output, fmt)
+    else:
+        with open(tmp_output, "wb") as out:
+            for n, path in enumerate(paths):
+                with open(path, "rb") as part:
+                    if fmt == "csv" and n > 0:
+                        part.readline()  # every part has the header; keep the first one
+                    shutil.copyfileobj(part, out)
+    os.replace(tmp_output, output)
+    shutil.rmtree(parts_dir)
+
+
+# ----- Driver -----
+def categorize_file(input_path, output, workers=1, threads=None, chunk_size=CHUNK_SIZE, in_fmt=None, out_fmt=None,
+                    model_dir="model", classifier="distilled", cascade=True, ngram_min_confidence=NGRAM_MIN_CONFIDENCE,
+                    restart=False, overwrite=False):
+    in_fmt = output_format(input_path, in_fmt)
+    out_fmt = output_format(output, out_fmt)
+    if in_fmt not in PART_EXTENSIONS or out_fmt not in PART_EXTENSIONS:
+        raise SystemExit("❌ Input and output must be CSV, NDJSON or Parquet.")
+    check_output_columns(input_path, in_fmt, overwrite)
+    parts_dir = f"{output}.parts"
+    manifest = run_manifest(input_path, in_fmt, out_fmt, chunk_size, model_dir, classifier, cascade,
+                            ngram_min_confidence, overwrite)
+    done = prepare_parts_dir(parts_dir, manifest, restart=restart)
+    if done:
+        print(f"⏩ Resuming: {len(done)} chunk(s) already written to {parts_dir}")
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    model_args = (model_dir, classifier, cascade, ngram_min_confidence, threads)
+
+    rows = chunks = 0
+    tiers = Counter()
+    started = time.perf_counter()
+
+    def collect(result):
+        nonlocal rows
+        chunk_no, n, chunk_tiers, seconds = result
+        rows += n
+        tiers.update(chunk_tiers)
+        rate = rows / max(time.perf_counter() - started, 1e-9)
+        print(f"🔄 Chunk {chunk_no}: {n:,} rows in {seconds:.1f}s, {rows:,} rows so far ({rate:,.0f} rows/s)",
+              flush=True)
+
+    def pending_chunks():
+        nonlocal chunks
+        for chunk_no, df in enumerate(read_chunks(input_path, in_fmt, chunk_size)):
+            chunks = chunk_no + 1
+            if chunk_no not in done:
+                yield chunk_no, df, parts_dir, out_fmt
+
+    print(f"🚀 Categorizing {input_path} ({in_fmt}) in chunks of {chunk_size:,} rows with {workers} worker(s)...")
+    if workers <= 1:
+        _init_worker(*model_args)
+        for args in pending_chunks():
+            collect(_categorize_chunk(args))
+    else:
+        # spawn: each worker loads its own models instead of inheriting torch state through fork.
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(workers, initializer=_init_worker, initargs=model_args) as pool:
+            # A bounded number of chunks in flight keeps memory flat however large the input is.
+            in_flight = deque()
+            for args in pending_chunks():
+                in_flight.append(pool.apply_async(_categorize_chunk, (args,)))
+                while in_flight and (in_flight[0].ready() or len(in_flight) >= 2 * workers):
+                    collect(in_flight.popleft().get())
+            while in_flight:
+                collect(in_flight.popleft().get())
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Categorized {rows:,} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s, "
+          f"{workers} worker(s))")
+    if rows:
+        print("📊 Tiers: " + ", ".join(f"{tier} {count / rows * 100:.1f}%" for tier, count in tiers.most_common()))
+    join_parts(parts_dir, chunks, output, out_fmt)
+    print(f"💾 Wrote {output}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Categorize a large transaction file offline.")
+    parser.add_argument("input", help="CSV, NDJSON (.ndjson/.jsonl) or Parquet file with a description column")
+    parser.add_argument("output", help="file to write; the input columns plus category, confidence and source")
+    parser.add_argument("--input-format", choices=list(PART_EXTENSIONS), help="override the input extension")
+    parser.add_argument("--format", choices=list(PART_EXTENSIONS), help="override the output extension")
+    parser.add_argument("--workers", type=int, default=1, help="processes categorizing chunks")
+    parser.add_argument("--threads", type=int, help="torch threads per worker (default: cores / workers)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows read and categorized at a time")
+    parser.add_argument("--model-dir", default="model", help="directory with embedder/ and the classifier")
+    parser.add_argument("--classifier", choices=["distilled", "ensemble"], default="distilled",
+                        help="distilled (falls back to the ensemble until model/distilled.npz exists) or ensemble")
+    parser.add_argument("--model-only", action="store_true",
+                        help="skip the merchant index and n-gram tier; every row goes through the embedder")
+    parser.add_argument("--ngram-min-confidence", type=float, default=NGRAM_MIN_CONFIDENCE,
+                        help="lowest n-gram confidence answered without the embedder")
+    parser.add_argument("--restart", action="store_true", help="discard the parts of an interrupted run")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="replace input columns named category, confidence or source")
+    args = parser.parse_args()
+
+    categorize_file(args.input, args.output, workers=args.workers, threads=args.threads, chunk_size=args.chunk_size,
+                    in_fmt=args.input_format, out_fmt=args.format, model_dir=args.model_dir,
+                    classifier=args.classifier, cascade=not args.model_only,
+                    ngram_min_confidence=args.ngram_min_confidence, restart=args.restart, overwrite=args.overwrite)
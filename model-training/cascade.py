@@ -0,0 +1,50 @@
+import numpy as np
+
+from ngram_classifier import NGRAM_MIN_CONFIDENCE
+
+# The categorization cascade, shared by server.py and batch_categorize.py:
+# known merchants are answered from the merchant index, rows the n-gram model
+# is sure about by that model, and only the rest reach the embedder and the
+# classifier. Nothing is loaded here; callers pass in their models.
+
+# Less confident classifier predictions become "Other".
+CONFIDENCE_THRESHOLD = 0.6
+
+
+def top_predictions(probas, classes):
+    # (categories, confidences): the most probable class of each row.
+    idx = np.argmax(probas, axis=1)
+    return classes[idx].astype(str).tolist(), probas[np.arange(len(idx)), idx].astype(float).tolist()
+
+
+def classify(probas, classes):
+    """(categories, confidences) of the classifier; below CONFIDENCE_THRESHOLD the category is "Other"."""
+    categories, confidences = top_predictions(probas, classes)
+    return ["Other" if confidence < CONFIDENCE_THRESHOLD else category
+            for category, confidence in zip(categories, confidences)], confidences
+
+
+def ngram_results(probas, classes, min_confidence=NGRAM_MIN_CONFIDENCE):
+    """(category, confidence, "ngram") per row, None where the n-gram model is less sure than the gate."""
+    # The tier never answers below the classifier's own threshold.
+    gate = max(min_confidence, CONFIDENCE_THRESHOLD)
+    categories, confidences = top_predictions(probas, classes)
+    return [(category, confidence, "ngram") if confidence >= gate else None
+            for category, confidence in zip(categories, confidences)]
+
+
+def run_cascade(rows, merchant_tier=None, ngram_tier=None, model_tier=None):
+    """(category, confidence, source) per row, in order.
+
+    Each tier is a function of a list of rows returning one result per row;
+    merchant_tier and ngram_tier return None for rows they leave to the next
+    tier, model_tier answers every row it gets. A tier that is None is skipped.
+    """
+    results = merchant_tier(rows) if merchant_tier is not None and rows else [None] * len(rows)
+    for tier in (ngram_tier, model_tier):
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending or tier is None:
+            continue
+        for i, result in zip(pending, tier([rows[i] for i in pending])):
+            results[i] = result
+    return results
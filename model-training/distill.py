@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+
+DISTILLED_PATH = "model/distilled.npz"
+
+
+class DistilledClassifier:
+    """Softmax regression on the embeddings, fitted to the ensemble's soft probabilities.
+
+    Drop-in for the ensemble in server.py (predict_proba()/classes_): one
+    (384 x classes) matrix multiply per batch instead of LogisticRegression
+    plus an XGBoost forest, and numpy is its only dependency.
+    """
+
+    def __init__(self, weights, bias, classes):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.classes_ = np.asarray(classes)
+
+    def predict_proba(self, X):
+        logits = np.asarray(X, dtype=np.float32) @ self.weights + self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        proba = np.exp(logits)
+        return proba / proba.sum(axis=1, keepdims=True)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    @classmethod
+    def fit(cls, X, teacher_proba, classes, l2=1e-6, max_iter=2000):
+        """Minimise cross-entropy against the teacher's probabilities (plus L2) with L-BFGS.
+
+        The embeddings are unit-length, so the weights need to grow large: l2 is
+        kept far weaker than LogisticRegression's default (C=1 means l2 = 1/n).
+        """
+        from scipy.optimize import minimize
+
+        X = np.asarray(X, dtype=np.float64)
+        target = np.asarray(teacher_proba, dtype=np.float64)
+        n, dim = X.shape
+        n_classes = target.shape[1]
+
+        def loss_and_grad(params):
+            W = params[:dim * n_classes].reshape(dim, n_classes)
+            b = params[dim * n_classes:]
+            logits = X @ W + b
+            logits -= logits.max(axis=1, keepdims=True)
+            log_proba = logits - np.log(np.exp(logits).sum(axis=1, keepdims=True))
+            loss = -(target * log_proba).sum() / n + 0.5 * l2 * (W * W).sum()
+            diff = (np.exp(log_proba) - target) / n
+            grad_W = X.T @ diff + l2 * W
+            return loss, np.concatenate([grad_W.ravel(), diff.sum(axis=0)])
+
+        result = minimize(loss_and_grad, np.zeros(dim * n_classes + n_classes), jac=True,
+                          method="L-BFGS-B", options={"maxiter": max_iter})
+        params = result.x
+        return cls(params[:dim * n_classes].reshape(dim, n_classes), params[dim * n_classes:], classes)
+
+    # ----- Persistence -----
+    def save(self, path=DISTILLED_PATH):
+        # Written beside the target and renamed over it: running servers poll this file.
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, weights=self.weights, bias=self.bias, classes=self.classes_.astype(str))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=DISTILLED_PATH):
+        with np.load(path, allow_pickle=False) as saved:
+            return cls(saved["weights"], saved["bias"], saved["classes"])
+
+    def size_bytes(self):
+        return self.weights.nbytes + self.bias.nbytes
@@ -0,0 +1,141 @@
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+# ----- Utility: Cache Key Normalization -----
+def normalize_key(text):
+    # Same rules as normalize_text() in text_prep.py. The embedder's tokenizer
+    # lowercases anyway, so this never changes the resulting vector.
+    text = text.lower().strip()
+    return re.sub(r'\s+', ' ', text)
+
+
+def embedder_fingerprint(path):
+    # Cheap identity for a saved embedder: file names and sizes.
+    h = hashlib.sha1()
+    for root, _, files in sorted(os.walk(path)):
+        for name in sorted(files):
+            full_path = os.path.join(root, name)
+            h.update(f"{os.path.relpath(full_path, path)}:{os.path.getsize(full_path)}".encode())
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    """Bounded LRU cache of embeddings keyed by normalized input text."""
+
+    def __init__(self, max_size=50000, path=None, namespace=""):
+        self.max_size = max_size
+        self.path = path
+        # Identifies the embedder the vectors came from, so a persisted cache
+        # written by a different model is ignored instead of served.
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._dirty = False
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def encode(self, texts, encode_fn):
+        """Return one embedding row per text, calling encode_fn only for unseen keys."""
+        keys = [normalize_key(t) for t in texts]
+        found = {}
+        missing = []
+        missing_set = set()
+        with self._lock:
+            for key in keys:
+                # Repeats of a key inside the same batch are encoded once and count as hits.
+                if key in found or key in missing_set:
+                    self.hits += 1
+                    continue
+                vec = self._entries.get(key)
+                if vec is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = vec
+                    self.hits += 1
+                else:
+                    missing.append(key)
+                    missing_set.add(key)
+                    self.misses += 1
+
+        if missing:
+            vecs = np.asarray(encode_fn(missing), dtype=np.float32)
+            if vecs.ndim == 1:
+                vecs = vecs.reshape(1, -1)
+            with self._lock:
+                for key, vec in zip(missing, vecs):
+                    found[key] = vec
+                    if self.max_size > 0:
+                        self._entries[key] = vec
+                        self._entries.move_to_end(key)
+                        self._dirty = True
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "persist_path": self.path,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    # ----- Persistence -----
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as saved:
+                if str(saved["namespace"]) != self.namespace:
+                    print(f"⚠️ Ignoring embedding cache at {self.path}: built by a different embedder")
+                    return
+                keys = saved["keys"].tolist()
+                vectors = saved["vectors"]
+        except Exception as e:
+            print(f"⚠️ Could not load embedding cache from {self.path}: {e}")
+            return
+        with self._lock:
+            # Keep only the most recently used entries if the cache was shrunk.
+            start = max(0, len(keys) - self.max_size)
+            for key, vec in zip(keys[start:], vectors[start:]):
+                self._entries[key] = vec
+        print(f"✅ Loaded {len(self._entries)} cached embeddings from {self.path}")
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            # Nothing new since load: don't overwrite a file other workers may have updated.
+            if not self._entries or not self._dirty:
+                return
+            self._dirty = False
+            keys = np.array(list(self._entries.keys()))
+            vectors = np.stack(list(self._entries.values()))
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temp file and rename, so concurrent workers never read a torn file.
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, keys=keys, vectors=vectors, namespace=np.array(self.namespace))
+        os.replace(tmp_path, self.path)
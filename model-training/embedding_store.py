@@ -0,0 +1,148 @@
+import os
+import re
+import time
+import hashlib
+import multiprocessing
+
+import numpy as np
+
+from embedding_cache import embedder_fingerprint
+
+EMBEDDING_STORE_DIR = "model/embedding_store"
+
+
+# ----- Utility: Keys -----
+def text_key(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def model_version(model_name_or_path):
+    # A saved embedder directory is identified by its files; a hub name by itself.
+    if os.path.isdir(model_name_or_path):
+        name = os.path.basename(os.path.normpath(model_name_or_path))
+        return f"{name}-{embedder_fingerprint(model_name_or_path)[:12]}"
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', model_name_or_path)
+
+
+class EmbeddingStore:
+    """On-disk training embeddings keyed by text hash, one directory per model version.
+
+    Each run that encodes new texts appends a segment (keys + float32 vectors
+    .npy); existing segments are memory-mapped, never rewritten.
+    """
+
+    def __init__(self, model_version, root=EMBEDDING_STORE_DIR):
+        self.dir = os.path.join(root, model_version)
+        os.makedirs(self.dir, exist_ok=True)
+        self._segments = []
+        self._index = {}
+        for name in sorted(os.listdir(self.dir)):
+            if name.endswith(".keys.npy"):
+                self._open_segment(name[:-len(".keys.npy")])
+
+    def __len__(self):
+        return len(self._index)
+
+    def _open_segment(self, segment):
+        keys = np.load(os.path.join(self.dir, f"{segment}.keys.npy"))
+        vectors = np.load(os.path.join(self.dir, f"{segment}.vectors.npy"), mmap_mode="r")
+        seg_id = len(self._segments)
+        self._segments.append(vectors)
+        for row, key in enumerate(keys.tolist()):
+            self._index[key.decode()] = (seg_id, row)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def get(self, keys):
+        out = None
+        by_segment = {}
+        for i, key in enumerate(keys):
+            seg_id, row = self._index[key]
+            by_segment.setdefault(seg_id, ([], []))
+            by_segment[seg_id][0].append(i)
+            by_segment[seg_id][1].append(row)
+        for seg_id, (positions, rows) in by_segment.items():
+            vectors = self._segments[seg_id]
+            if out is None:
+                out = np.empty((len(keys), vectors.shape[1]), dtype=np.float32)
+            out[positions] = vectors[rows]
+        return out if out is not None else np.empty((0, 0), dtype=np.float32)
+
+    def add(self, keys, vectors):
+        if not keys:
+            return
+        segment = f"seg-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{len(self._segments):04d}"
+        # Vectors first, keys last: a segment only counts once its keys file exists.
+        for suffix, array in ((".vectors.npy", np.asarray(vectors, dtype=np.float32)),
+                              (".keys.npy", np.array(keys, dtype="S32"))):
+            tmp_path = os.path.join(self.dir, f"tmp-{segment}{suffix}")
+            np.save(tmp_path, array)
+            os.replace(tmp_path, os.path.join(self.dir, f"{segment}{suffix}"))
+        self._open_segment(segment)
+
+
+# ----- Parallel Encoding -----
+_worker_embedder = None
+
+
+def _init_worker(model_name_or_path, threads):
+    global _worker_embedder
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    _worker_embedder = SentenceTransformer(model_name_or_path)
+
+
+def _encode_chunk(args):
+    start, texts, batch_size = args
+    return start, _worker_embedder.encode(texts, batch_size=batch_size)
+
+
+def encode_parallel(texts, model_name_or_path, workers=1, chunk_size=2048, batch_size=64):
+    """Encode texts in chunks across worker processes, reporting progress and throughput."""
+    total = len(texts)
+    out = None
+    done = 0
+    started = time.perf_counter()
+    chunks = [(i, texts[i:i + chunk_size], batch_size) for i in range(0, total, chunk_size)]
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    def collect(results):
+        nonlocal out, done
+        for start, vectors in results:
+            if out is None:
+                out = np.empty((total, vectors.shape[1]), dtype=np.float32)
+            out[start:start + len(vectors)] = vectors
+            done += len(vectors)
+            rate = done / max(time.perf_counter() - started, 1e-9)
+            print(f"🔄 Encoded {done:,}/{total:,} ({rate:,.0f} rows/s)", flush=True)
+
+    if workers <= 1:
+        _init_worker(model_name_or_path, threads)
+        collect(_encode_chunk(chunk) for chunk in chunks)
+    else:
+        # spawn: each worker loads its own model instead of inheriting torch state through fork.
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(workers, initializer=_init_worker, initargs=(model_name_or_path, threads)) as pool:
+            collect(pool.imap_unordered(_encode_chunk, chunks))
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Encoded {total:,} texts in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s, {workers} worker(s))")
+    return out
+
+
+def encode_with_store(texts, model_name_or_path, workers=1, chunk_size=2048, store_dir=EMBEDDING_STORE_DIR):
+    """Embeddings for texts; only texts not already in the store are encoded."""
+    store = EmbeddingStore(model_version(model_name_or_path), store_dir)
+    keys = [text_key(t) for t in texts]
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in store and key not in missing:
+            missing[key] = text
+    print(f"💾 Embedding store {store.dir}: {len(texts) - len(missing):,} cached, {len(missing):,} to encode")
+    if missing:
+        vectors = encode_parallel(list(missing.values()), model_name_or_path, workers, chunk_size)
+        store.add(list(missing.keys()), vectors)
+    return store.get(keys)
@@ -0,0 +1,289 @@
+import os
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Synthetic labelled transactions for load tests and training runs, in the
+# columns of synthetic_data.csv. Rows are drawn with numpy a chunk at a time
+# and written before the next chunk is drawn, so memory stays flat.
+
+CHUNK_SIZE = int(os.environ.get("GENERATOR_CHUNK_SIZE", "100000"))
+# Any TTF with the ₹ glyph, so amounts render as ₹ rather than a missing-glyph box; the parser does not need it.
+STATEMENT_FONT = os.environ.get("STATEMENT_FONT", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf")
+
+# ----- Tables (from the original generate_transactions notebook) -----
+CATEGORIES = [
+    "Groceries", "Bills", "Entertainment", "Shopping", "Utilities", "Income",
+    "Travel", "Transportation", "Healthcare", "Education", "Dining",
+    "Fitness", "Tech", "Personal Care", "Automotive", "Home Improvement", "Finance"
+]
+
+MERCHANTS = {
+    "Groceries": ["Walmart", "Whole Foods", "Trader Joe's", "Kroger", "Safeway", "Costco", "Aldi", "Publix"],
+    "Bills": ["AT&T", "Comcast", "Verizon", "T-Mobile", "Xfinity", "Spectrum", "DirectTV", "Geico"],
+    "Entertainment": ["Netflix", "Spotify", "Hulu", "Steam", "AMC Theatres", "Disney+", "Apple Music", "Twitch"],
+    "Shopping": ["Amazon", "eBay", "Zara", "H&M", "Best Buy", "Target", "Macy's", "Nike"],
+    "Utilities": ["PG&E", "Water Company", "Electric Co", "Utility Board", "City Gas", "ConEd", "National Grid", "Duke Energy"],
+    "Income": ["Salary Payment", "Freelance", "Upwork", "Bonus", "Commission", "Dividend", "Interest", "Rental Income"],
+    "Travel": ["Delta Airlines", "United Airlines", "American Airlines", "Emirates", "Qatar Airways", "Lufthansa", "Air India", "British Airways", "Southwest Airlines", "JetBlue"],
+    "Transportation": ["Uber", "Lyft", "Taxi Service", "Metro", "Bus Express", "Amtrak", "Bolt", "Grab"],
+    "Healthcare": ["CVS Pharmacy", "Walgreens", "Kaiser Permanente", "Mayo Clinic", "HealthNet", "UnitedHealthcare", "Cigna", "Aetna"],
+    "Education": ["Coursera", "Udemy", "edX", "Khan Academy", "Skillshare", "LinkedIn Learning", "Udacity"],
+    "Dining": ["McDonald's", "Burger King", "Starbucks", "Subway", "Chipotle", "Domino's", "Pizza Hut", "Panera Bread", "Dunkin' Donuts"],
+    "Fitness": ["Planet Fitness", "Gold's Gym", "24 Hour Fitness", "Anytime Fitness", "LA Fitness", "Equinox", "Fitness First"],
+    "Tech": ["Apple Store", "Microsoft Store", "Best Buy", "Dell", "Amazon Tech", "Newegg", "B&H Photo Video", "Adorama"],
+    "Personal Care": ["Sephora", "Ulta Beauty", "The Body Shop", "Lush", "Bath & Body Works", "Glossier", "Victoria's Secret"],
+    "Automotive": ["Shell", "ExxonMobil", "BP", "Chevron", "Total", "AutoZone", "Pep Boys", "Costco Gas"],
+    "Home Improvement": ["Home Depot", "Lowe's", "IKEA", "Menards", "Ace Hardware", "True Value"],
+    "Finance": ["Chase Bank", "Bank of America", "Wells Fargo", "Citi", "Capital One", "HSBC", "TD Bank", "PNC Bank"]
+}
+
+CATEGORY_ITEMS = {
+    "Groceries": ["groceries", "food", "household items", "snacks", "beverages", "produce", "dairy", "bakery", "frozen foods"],
+    "Bills": ["internet", "phone", "cable", "insurance", "credit card", "mortgage", "rent", "electricity", "water", "gas bill"],
+    "Entertainment": ["movie", "concert", "game", "subscription", "event", "streaming", "music", "festival", "show"],
+    "Shopping": ["clothing", "electronics", "books", "home decor", "gifts", "shoes", "furniture", "accessories"],
+    "Utilities": ["electricity", "water", "gas", "sewage", "trash", "heating", "cooling", "maintenance"],
+    "Income": ["salary", "bonus", "freelance", "investment", "refund", "gift", "grant", "commission"],
+    "Travel": ["flight", "hotel", "vacation", "trip", "journey", "cruise", "tour"],
+    "Transportation": ["ride", "cab fare", "bus ticket", "train ticket", "metro pass"],
+    "Healthcare": ["medical bill", "prescription", "checkup", "surgery", "consultation", "lab test"],
+    "Education": ["tuition", "course fee", "workshop", "seminar", "textbooks", "subscription"],
+    "Dining": ["lunch", "dinner", "brunch", "snack", "beverage", "coffee", "meal"],
+    "Fitness": ["gym membership", "personal training", "fitness class", "yoga session", "bootcamp"],
+    "Tech": ["laptop", "smartphone", "accessory", "software", "gadget", "tablet"],
+    "Personal Care": ["makeup", "skincare", "haircut", "spa", "massage", "perfume"],
+    "Automotive": ["fuel", "oil change", "car repair", "service", "tire replacement"],
+    "Home Improvement": ["furniture", "tool", "DIY supplies", "garden", "appliance", "painting"],
+    "Finance": ["bank fee", "investment", "loan", "credit card fee", "finance charge"]
+}
+
+# (min, max) amount per category.
+AMOUNT_RANGES = {
+    "Groceries": (10, 200),
+    "Bills": (40, 600),
+    "Entertainment": (5, 150),
+    "Shopping": (20, 1500),
+    "Utilities": (30, 400),
+    "Income": (1000, 5000),
+    "Travel": (100, 3000),
+    "Transportation": (2, 100),
+    "Healthcare": (20, 1000),
+    "Education": (50, 1000),
+    "Dining": (5, 100),
+    "Fitness": (10, 150),
+    "Tech": (200, 3000),
+    "Personal Care": (10, 200),
+    "Automotive": (10, 500),
+    "Home Improvement": (50, 2000),
+    "Finance": (1, 30)
+}
+
+TEMPLATES_WITH_MERCHANT = [
+    "{merchant} purchase",
+    "Payment to {merchant}",
+    "{merchant} - {item}",
+    "Subscription to {merchant}",
+    "Bill from {merchant}",
+    "Shopping at {merchant}"
+]
+
+TEMPLATES_WITHOUT_MERCHANT = [
+    "{category} expense",
+    "{category} payment",
+    "{category} - {item}",
+    "General {category}"
+]
+
+MERCHANT_SHARE = 0.8  # share of descriptions that name a merchant
+CREDIT_CATEGORIES = {"Income"}
+COLUMNS = ["date", "description", "transactionId", "amount", "category", "transactionType"]
+
+
+# ----- Description Vocabulary -----
+def build_vocabulary():
+    """Every description each category can produce, flattened into one array.
+
+    A row's description is then a single index into it: uniform template,
+    merchant and item choices become uniform integers, as random.choice() was.
+    Returns (vocab, per-category offsets with and without a merchant, merchant and item counts).
+    """
+    vocab = []
+    with_offset, without_offset, n_merchants, n_items = [], [], [], []
+    for category in CATEGORIES:
+        merchants, items = MERCHANTS[category], CATEGORY_ITEMS[category]
+        with_offset.append(len(vocab))
+        vocab += [t.format(merchant=m, item=i) for t in TEMPLATES_WITH_MERCHANT for m in merchants for i in items]
+        without_offset.append(len(vocab))
+        vocab += [t.format(category=category, item=i) for t in TEMPLATES_WITHOUT_MERCHANT for i in items]
+        n_merchants.append(len(merchants))
+        n_items.append(len(items))
+    return (np.array(vocab, dtype=object), np.array(with_offset), np.array(without_offset),
+            np.array(n_merchants), np.array(n_items))
+
+
+VOCAB, WITH_OFFSET, WITHOUT_OFFSET, N_MERCHANTS, N_ITEMS = build_vocabulary()
+AMOUNT_LOW = np.array([AMOUNT_RANGES[c][0] for c in CATEGORIES], dtype=np.float64)
+AMOUNT_HIGH = np.array([AMOUNT_RANGES[c][1] for c in CATEGORIES], dtype=np.float64)
+IS_CREDIT = np.array([c in CREDIT_CATEGORIES for c in CATEGORIES])
+
+
+def uniform_index(rng, sizes):
+    # One uniform integer in [0, size) per row, for per-row sizes.
+    return (rng.random(len(sizes)) * sizes).astype(np.int64)
+
+
+def generate_chunk(rng, n, first_id, dates):
+    """n labelled transactions as a DataFrame with the synthetic_data.csv columns."""
+    cat = rng.integers(len(CATEGORIES), size=n)
+    items = uniform_index(rng, N_ITEMS[cat])
+    with_merchant = rng.random(n) < MERCHANT_SHARE
+    merchant_idx = (uniform_index(rng, np.full(n, len(TEMPLATES_WITH_MERCHANT))) * N_MERCHANTS[cat]
+                    + uniform_index(rng, N_MERCHANTS[cat])) * N_ITEMS[cat] + items
+    plain_idx = uniform_index(rng, np.full(n, len(TEMPLATES_WITHOUT_MERCHANT))) * N_ITEMS[cat] + items
+    desc_idx = np.where(with_merchant, WITH_OFFSET[cat] + merchant_idx, WITHOUT_OFFSET[cat] + plain_idx)
+
+    amount = np.round(rng.uniform(AMOUNT_LOW[cat], AMOUNT_HIGH[cat]), 2)
+    ids = np.arange(first_id, first_id + n).astype(str)
+    return pd.DataFrame({
+        "date": dates[rng.integers(len(dates), size=n)],
+        "description": VOCAB[desc_idx],
+        "transactionId": np.char.add("T", np.char.zfill(ids, 12)),
+        "amount": amount,
+        "category": np.array(CATEGORIES, dtype=object)[cat],
+        "transactionType": np.where(IS_CREDIT[cat], "credit", "debit"),
+    }, columns=COLUMNS)
+
+
+def generate(rows, seed=42, chunk_size=CHUNK_SIZE, start="2025-01-01", end="2025-12-31"):
+    """Yield DataFrames of up to chunk_size rows; the same seed and chunk_size give the same rows."""
+    # Formatted once: every row's date is an index into this array.
+    dates = pd.date_range(start, end, freq="D").strftime("%d %b %Y").to_numpy(dtype=object)
+    for chunk_no, first in enumerate(range(0, rows, chunk_size)):
+        # An independent stream per chunk, derived from the seed and the chunk number.
+        rng = np.random.default_rng([seed, chunk_no])
+        yield generate_chunk(rng, min(chunk_size, rows - first), first, dates)
+
+
+# ----- Writers -----
+def output_format(path, fmt=None):
+    if fmt:
+        return fmt
+    ext = os.path.splitext(path)[1].lower()
+    return {".csv": "csv", ".parquet": "parquet", ".ndjson": "ndjson", ".jsonl": "ndjson", ".pdf": "pdf"}.get(ext, "csv")
+
+
+def write_table(chunks, path, fmt):
+    """Write DataFrame chunks to CSV, NDJSON or Parquet as they arrive; returns the row count."""
+    rows = 0
+    if fmt == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("❌ Parquet output needs pyarrow (pip install pyarrow).")
+        writer = None
+        try:
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                writer = writer or pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+                rows += len(chunk)
+        finally:
+            if writer:
+                writer.close()
+        return rows
+
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for chunk in chunks:
+            if fmt == "ndjson":
+                # One transaction object per line, as /bulk_predict_stream reads them.
+                f.write(chunk.to_json(orient="records", lines=True, force_ascii=False))
+            else:
+                chunk.to_csv(f, header=rows == 0, index=False)
+            rows += len(chunk)
+    return rows
+
+
+# ----- Statement PDFs -----
+# One renderer per backend statement format (backend/statement_formats.py).
+def upi_4line_lines(row, n):
+    date = pd.Timestamp(row.date).strftime("%b %d, %Y")
+    direction = "Received from" if row.transactionType == "credit" else "Paid to"
+    hour, minute = divmod(n * 37 % 1440, 60)
+    return [
+        f"{date} {direction} {row.description} {row.transactionType.upper()} ₹{row.amount:,.2f}",
+        f"{hour:02d}:{minute:02d} Transaction ID {row.transactionId}",
+        f"UTR No. {500000000000 + n}",
+        f"Paid by XXXXXX{1000 + n % 9000}",
+    ]
+
+
+def upi_ledger_lines(row, n):
+    date = pd.Timestamp(row.date).strftime("%d/%m/%Y")
+    dr = row.transactionType != "credit"
+    payee = row.description.replace("/", " ")
+    return [f"{date} UPI/{'DR' if dr else 'CR'}/{500000000000 + n}/{payee}/YESB/pay@ybl "
+            f"{row.amount:,.2f} {'Dr' if dr else 'Cr'}"]
+
+
+STATEMENT_RENDERERS = {"upi_4line": upi_4line_lines, "upi_ledger": upi_ledger_lines}
+
+
+def write_statement_pdf(chunks, path, statement_format="upi_4line", font_path=STATEMENT_FONT):
+    """Render transactions as a UPI statement PDF that backend/statement_parser.py reads back."""
+    try:
+        from reportlab.pdfgen import canvas
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+    except ImportError:
+        raise SystemExit("❌ PDF output needs reportlab (pip install reportlab).")
+    if not os.path.exists(font_path):
+        raise SystemExit(f"❌ Font {font_path} not found; set STATEMENT_FONT to a TTF with the ₹ glyph.")
+
+    pdfmetrics.registerFont(TTFont("StatementFont", font_path))
+    render = STATEMENT_RENDERERS[statement_format]
+    pdf = canvas.Canvas(path)
+    top, bottom, leading = 800, 60, 14
+    y = top
+    pdf.setFont("StatementFont", 9)
+    rows = 0
+    for chunk in chunks:
+        for row in chunk.itertuples(index=False):
+            for line in render(row, rows):
+                if y < bottom:
+                    pdf.showPage()
+                    pdf.setFont("StatementFont", 9)
+                    y = top
+                pdf.drawString(40, y, line)
+                y -= leading
+            rows += 1
+    pdf.save()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic labelled transactions.")
+    parser.add_argument("rows", type=int, help="number of transactions")
+    parser.add_argument("output", help="file to write (.csv, .parquet, .ndjson/.jsonl or .pdf)")
+    parser.add_argument("--format", choices=["csv", "parquet", "ndjson", "pdf"], help="override the extension")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows generated and written at a time")
+    parser.add_argument("--start", default="2025-01-01", help="first transaction date")
+    parser.add_argument("--end", default="2025-12-31", help="last transaction date")
+    parser.add_argument("--statement-format", choices=sorted(STATEMENT_RENDERERS), default="upi_4line",
+                        help="statement layout for .pdf output")
+    args = parser.parse_args()
+
+    fmt = output_format(args.output, args.format)
+    chunks = generate(args.rows, seed=args.seed, chunk_size=args.chunk_size, start=args.start, end=args.end)
+    started = time.perf_counter()
+    if fmt == "pdf":
+        written = write_statement_pdf(chunks, args.output, args.statement_format)
+    else:
+        written = write_table(chunks, args.output, fmt)
+    elapsed = time.perf_counter() - started
+    print(f"✅ Wrote {written} transactions to {args.output} ({fmt}) in {elapsed:.1f}s "
+          f"({written / max(elapsed, 1e-9):,.0f} rows/s)")
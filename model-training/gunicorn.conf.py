@@ -0,0 +1,34 @@
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get("GUNICORN_WORKERS", "1"))
+# Threads let one worker serve concurrent /predict calls, which the micro-batcher coalesces.
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+# Load the models once in the master; forked workers share those pages copy-on-write
+# instead of each holding its own copy. Set GUNICORN_PRELOAD=0 to load per worker.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+# Intra-op threads per worker for torch / ONNX Runtime (default: cores split across workers).
+inference_threads = int(os.environ.get("INFERENCE_THREADS", "0")) or max(1, (os.cpu_count() or 1) // workers)
+
+
+def pre_fork(server, worker):
+    # Keep the GC from touching the preloaded objects in the workers, which
+    # would otherwise write to (and un-share) their pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from server import worker_init
+    worker_init(inference_threads)
+
+
+def child_exit(server, worker):
+    from metrics import mark_worker_dead
+    mark_worker_dead(worker.pid)
+
+
+def worker_exit(server, worker):
+    from server import embedding_cache
+    embedding_cache.save()
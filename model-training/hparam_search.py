@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+SEARCH_DIR = "model/hparam_search"
+PARAM_GRID = {
+    'lr__C': [0.5, 1.0, 2.0],
+    'xgb__max_depth': [3, 5, 7],
+}
+# XGBoost's default n_estimators: the budget every candidate got under GridSearchCV.
+MAX_ROUNDS = 100
+CV_FOLDS = 3
+
+
+def build_ensemble(params=None, n_estimators=None, threads=None):
+    """The soft-voting LR + XGBoost ensemble; threads=None lets both use every core."""
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.ensemble import VotingClassifier
+    import xgboost as xgb
+
+    clf_lr = LogisticRegression(max_iter=3000, C=1.0, solver='lbfgs', n_jobs=-1)
+    # Force XGBoost to use the CPU-based 'hist' tree method.
+    clf_xgb = xgb.XGBClassifier(tree_method='hist', eval_metric='mlogloss', n_jobs=threads,
+                                **({"n_estimators": n_estimators} if n_estimators else {}))
+    # Soft voting averages the two models' probabilities.
+    ensemble = VotingClassifier(estimators=[('lr', clf_lr), ('xgb', clf_xgb)], voting='soft',
+                                n_jobs=1 if threads else -1)
+    return ensemble.set_params(**(params or {}))
+
+
+def data_fingerprint(X, y):
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(X, dtype=np.float32).tobytes())
+    h.update("\n".join(map(str, y)).encode())
+    return h.hexdigest()[:16]
+
+
+def fold_indices(y, cv):
+    from sklearn.model_selection import StratifiedKFold
+    return list(StratifiedKFold(n_splits=cv, shuffle=True, random_state=42).split(np.zeros(len(y)), y))
+
+
+# ----- Worker Processes -----
+_X = _y = _folds = None
+
+
+def _init_worker(x_path, y_path, cv, threads):
+    global _X, _y, _folds
+    from threadpoolctl import threadpool_limits
+
+    # Every library's thread pool (BLAS, OpenMP) gets the same per-task budget,
+    # so workers x threads never exceeds the cores.
+    threadpool_limits(threads)
+    _X = np.load(x_path, mmap_mode="r")
+    _y = np.load(y_path)
+    _folds = fold_indices(_y, cv)
+
+
+def _run_trial(trial, threads):
+    train_idx, val_idx = _folds[trial["fold"]]
+    start = time.perf_counter()
+    model = build_ensemble(trial["params"], n_estimators=trial["rounds"], threads=threads)
+    model.fit(_X[train_idx], _y[train_idx])
+    score = float(np.mean(model.predict(_X[val_idx]) == _y[val_idx]))
+    return {**trial, "score": score, "seconds": round(time.perf_counter() - start, 2)}
+
+
+# ----- Checkpoint -----
+def trial_key(trial):
+    return json.dumps([trial["data"], trial["params"], trial["fold"], trial["rounds"]], sort_keys=True)
+
+
+def load_checkpoint(path):
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by the interruption
+            done[trial_key(result)] = result
+    return done
+
+
+class SearchRunner:
+    """Runs trials on a process pool with a fixed thread budget each, checkpointing every result."""
+
+    def __init__(self, X, y, workers, threads, cv=CV_FOLDS, search_dir=SEARCH_DIR):
+        self.fingerprint = data_fingerprint(X, y)
+        self.workers = workers
+        self.threads = threads
+        self.cv = cv
+        os.makedirs(search_dir, exist_ok=True)
+        self.checkpoint = os.path.join(search_dir, "trials.jsonl")
+        self.done = load_checkpoint(self.checkpoint)
+        # Workers memory-map the embeddings instead of each receiving a copy.
+        self.x_path = os.path.join(search_dir, f"X-{self.fingerprint}.npy")
+        self.y_path = os.path.join(search_dir, f"y-{self.fingerprint}.npy")
+        if not os.path.exists(self.x_path):
+            np.save(self.y_path, np.asarray(y, dtype=str))
+            np.save(self.x_path, np.asarray(X, dtype=np.float32))
+        self._pool = None
+
+    def __enter__(self):
+        # spawn: train_model.py has torch loaded, which must not be forked.
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                         initializer=_init_worker,
+                                         initargs=(self.x_path, self.y_path, self.cv, self.threads))
+        return self
+
+    def __exit__(self, *exc):
+        self._pool.shutdown(cancel_futures=True)
+
+    def run(self, candidates, rounds):
+        """Fold scores of every candidate at this budget, in candidate order."""
+        trials = [{"data": self.fingerprint, "params": params, "fold": fold, "rounds": rounds}
+                  for params in candidates for fold in range(self.cv)]
+        pending = [t for t in trials if trial_key(t) not in self.done]
+        if len(pending) < len(trials):
+            print(f"♻️ {len(trials) - len(pending)} of {len(trials)} trials restored from {self.checkpoint}")
+        futures = [self._pool.submit(_run_trial, trial, self.threads) for trial in pending]
+        with open(self.checkpoint, "a") as f:
+            for future in as_completed(futures):
+                result = future.result()
+                self.done[trial_key(result)] = result
+                f.write(json.dumps(result) + "\n")
+                f.flush()
+                print(f"   {result['params']} fold {result['fold']} @ {rounds} rounds: "
+                      f"{result['score']*100:.2f}% ({result['seconds']}s)")
+        return [[self.done[trial_key(t)]["score"] for t in trials if t["params"] == params]
+                for params in candidates]
+
+
+def halving_rungs(n_candidates, max_rounds, eta, min_rounds=10):
+    """(candidates, boosting rounds) per rung, smallest budget first.
+
+    Each rung keeps the best len // eta of the one before (at least one), and
+    the last gets max_rounds. Rungs whose budget would not grow (min_rounds
+    floor) are merged into the rung before them, which then keeps as many
+    candidates as the merged rungs would have.
+    """
+    if eta <= 1 or n_candidates <= 1:
+        return [(n_candidates, max_rounds)]
+    counts = [n_candidates]
+    while counts[-1] > 1:
+        counts.append(max(1, counts[-1] // eta))
+    rungs = []
+    for r, count in enumerate(counts):
+        rounds = min(max_rounds, max(min_rounds, int(max_rounds / eta ** (len(counts) - 1 - r))))
+        if rungs and rounds <= rungs[-1][1]:
+            continue  # same budget: the previous rung's scores already rank these
+        rungs.append((count, rounds))
+    return rungs
+
+
+def search(X, y, param_grid=PARAM_GRID, workers=None, threads=2, eta=3, max_rounds=MAX_ROUNDS,
+           cv=CV_FOLDS, search_dir=SEARCH_DIR):
+    """Successive halving over param_grid; returns (best params, its fold scores at max_rounds).
+
+    Every candidate is cross-validated with a small XGBoost budget; the best
+    1/eta move on to eta times the rounds, until the survivors get max_rounds.
+    eta=1 is a plain grid search. Finished trials are appended to
+    search_dir/trials.jsonl, so re-running an interrupted search skips them.
+    """
+    workers = workers or max(1, (os.cpu_count() or 1) // threads)
+    keys = sorted(param_grid)
+    candidates = [dict(zip(keys, values)) for values in itertools.product(*(param_grid[k] for k in keys))]
+    rungs = halving_rungs(len(candidates), max_rounds, eta)
+    print(f"🔎 Searching {len(candidates)} candidates x {cv} folds, rounds per rung {[r for _, r in rungs]}, "
+          f"{workers} worker(s) x {threads} thread(s)")
+    started = time.perf_counter()
+    with SearchRunner(X, y, workers, threads, cv, search_dir) as runner:
+        for rung, (_, rounds) in enumerate(rungs):
+            scores = runner.run(candidates, rounds)
+            ranked = sorted(zip(candidates, scores), key=lambda cs: -np.mean(cs[1]))
+            print(f"📊 Rung {rung} ({rounds} rounds): best {np.mean(ranked[0][1])*100:.2f}% {ranked[0][0]}")
+            if rung < len(rungs) - 1:
+                candidates = [c for c, _ in ranked[:rungs[rung + 1][0]]]
+    print(f"✅ Search finished in {time.perf_counter() - started:.1f}s")
+    return ranked[0]
+
+
+if __name__ == "__main__":
+    # Re-tune on the embeddings saved by the last training run, without re-encoding.
+    parser = argparse.ArgumentParser(description="Successive-halving hyperparameter search for the ensemble.")
+    parser.add_argument("--training-set", default="model/training_set.npz")
+    parser.add_argument("--workers", type=int, help="search processes (default: cores / threads)")
+    parser.add_argument("--threads", type=int, default=2, help="threads per trial")
+    parser.add_argument("--eta", type=int, default=3, help="keep 1/eta per rung; 1 = full grid")
+    args = parser.parse_args()
+
+    with np.load(args.training_set, allow_pickle=False) as saved:
+        X, y = saved["X"], saved["y"]
+    best_params, fold_scores = search(X, y, workers=args.workers, threads=args.threads, eta=args.eta)
+    print(f"🏆 Best params: {best_params}, CV accuracy {np.mean(fold_scores)*100:.2f}% ± {np.std(fold_scores)*100:.2f}%")
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+
+KNN_DIR = "model/knn"
+EMBEDDINGS_NPY = "embeddings.npy"
+LABELS_NPY = "labels.npy"
+CLASSES_JSON = "classes.json"
+
+
+class KnnClassifier:
+    """Cosine top-k neighbour voting over stored training embeddings.
+
+    Drop-in for the ensemble in server.py (predict_proba()/classes_). Embeddings
+    are stored as float16 and memory-mapped, so workers share the page cache;
+    scoring upcasts them block by block. New labelled rows can be add()ed
+    without retraining anything.
+    """
+
+    def __init__(self, embeddings, labels, classes, k=10, ann=False, block_size=8192):
+        self.embeddings = embeddings
+        self.labels = np.asarray(labels)
+        self.classes_ = np.asarray(classes)
+        self.k = k
+        self.block_size = block_size
+        self.index = self._build_ann() if ann else None
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _build_ann(self):
+        # Optional HNSW index; falls back to exact search without faiss.
+        try:
+            import faiss
+        except ImportError:
+            print("⚠️ faiss is not installed; using exact kNN search")
+            return None
+        index = faiss.IndexHNSWFlat(self.embeddings.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+        index.add(np.ascontiguousarray(self.embeddings, dtype=np.float32))
+        return index
+
+    def kneighbors(self, X):
+        """Return (similarities, indices), each (n, k), best first."""
+        X = np.asarray(X, dtype=np.float32)
+        k = min(self.k, len(self.labels))
+        if self.index is not None:
+            return self.index.search(X, k)
+
+        best_sim = np.full((len(X), k), -np.inf, dtype=np.float32)
+        best_idx = np.zeros((len(X), k), dtype=np.int64)
+        for start in range(0, len(self.labels), self.block_size):
+            block = np.asarray(self.embeddings[start:start + self.block_size], dtype=np.float32)
+            # Embeddings are L2-normalized, so the dot product is the cosine similarity.
+            sims = X @ block.T
+            block_k = min(k, len(block))
+            top = np.argpartition(-sims, block_k - 1, axis=1)[:, :block_k]
+            # Merge this block's top-k with the running top-k.
+            cand_sim = np.concatenate([best_sim, np.take_along_axis(sims, top, axis=1)], axis=1)
+            cand_idx = np.concatenate([best_idx, top + start], axis=1)
+            keep = np.argpartition(-cand_sim, k - 1, axis=1)[:, :k]
+            best_sim = np.take_along_axis(cand_sim, keep, axis=1)
+            best_idx = np.take_along_axis(cand_idx, keep, axis=1)
+        order = np.argsort(-best_sim, axis=1)
+        return np.take_along_axis(best_sim, order, axis=1), np.take_along_axis(best_idx, order, axis=1)
+
+    def predict_proba(self, X):
+        sims, idx = self.kneighbors(X)
+        # Similarity-weighted votes; negative similarities don't vote.
+        weights = np.clip(sims, 0, None)
+        proba = np.zeros((len(sims), len(self.classes_)), dtype=np.float64)
+        rows = np.repeat(np.arange(len(sims)), sims.shape[1])
+        np.add.at(proba, (rows, self.labels[idx].ravel()), weights.ravel())
+        totals = proba.sum(axis=1, keepdims=True)
+        return np.divide(proba, totals, out=np.full_like(proba, 1.0 / len(self.classes_)), where=totals > 0)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def add(self, vectors, categories):
+        """Append labelled embeddings; unseen categories are added to classes_."""
+        classes = list(self.classes_)
+        for category in categories:
+            if category not in classes:
+                classes.append(category)
+        lookup = {c: i for i, c in enumerate(classes)}
+        self.classes_ = np.asarray(classes)
+        self.labels = np.concatenate([self.labels, [lookup[c] for c in categories]]).astype(np.int16)
+        self.embeddings = np.concatenate([np.asarray(self.embeddings), np.asarray(vectors, dtype=np.float16)])
+        if self.index is not None:
+            self.index.add(np.asarray(vectors, dtype=np.float32))
+
+    # ----- Persistence -----
+    @classmethod
+    def from_labelled(cls, vectors, categories, **kwargs):
+        classes, labels = np.unique(np.asarray(categories), return_inverse=True)
+        return cls(np.asarray(vectors, dtype=np.float16), labels.astype(np.int16), classes, **kwargs)
+
+    def save(self, out_dir=KNN_DIR):
+        # Each file is written beside its target and renamed over it: running
+        # servers memory-map embeddings.npy and reload once classes.json changes.
+        os.makedirs(out_dir, exist_ok=True)
+        for name, array in ((EMBEDDINGS_NPY, np.asarray(self.embeddings, dtype=np.float16)),
+                            (LABELS_NPY, self.labels.astype(np.int16))):
+            tmp_path = os.path.join(out_dir, f"tmp-{name}")
+            np.save(tmp_path, array)
+            os.replace(tmp_path, os.path.join(out_dir, name))
+        tmp_path = os.path.join(out_dir, f"tmp-{CLASSES_JSON}")
+        with open(tmp_path, "w") as f:
+            json.dump([str(c) for c in self.classes_], f)
+        os.replace(tmp_path, os.path.join(out_dir, CLASSES_JSON))
+
+    @classmethod
+    def load(cls, out_dir=KNN_DIR, mmap=True, **kwargs):
+        embeddings = np.load(os.path.join(out_dir, EMBEDDINGS_NPY), mmap_mode="r" if mmap else None)
+        labels = np.load(os.path.join(out_dir, LABELS_NPY))
+        with open(os.path.join(out_dir, CLASSES_JSON)) as f:
+            classes = json.load(f)
+        return cls(embeddings, labels, classes, **kwargs)
+
+
+# ----- Step: Build / Extend / Benchmark from Labelled CSVs -----
+def load_labelled_texts(path, limit=None):
+    from text_prep import build_input_texts, read_transactions
+
+    df = read_transactions(path)
+    if limit:
+        df = df.head(limit)
+    # Same input strings server.py embeds.
+    return build_input_texts(df), df["Category"].astype(str).tolist()
+
+
+def encode(texts, embedder_path="model/embedder"):
+    from sentence_transformers import SentenceTransformer
+
+    embedder = SentenceTransformer(embedder_path)
+    return embedder.encode(texts, batch_size=256, show_progress_bar=True, normalize_embeddings=True)
+
+
+def build(path, out_dir, limit=None):
+    texts, categories = load_labelled_texts(path, limit)
+    knn = KnnClassifier.from_labelled(encode(texts), categories)
+    knn.save(out_dir)
+    size_mb = os.path.getsize(os.path.join(out_dir, EMBEDDINGS_NPY)) / 1e6
+    print(f"✅ Saved {len(knn)} embeddings ({size_mb:.1f} MB, float16) to {out_dir}")
+
+
+def extend(paths, out_dir):
+    knn = KnnClassifier.load(out_dir, mmap=False)
+    for path in paths:
+        texts, categories = load_labelled_texts(path)
+        knn.add(encode(texts), categories)
+    knn.save(out_dir)
+    print(f"✅ Index now holds {len(knn)} embeddings")
+
+
+def benchmark(path, k, limit=None, test_size=0.2, ann=False):
+    import joblib
+    from sklearn.base import clone
+    from sklearn.model_selection import train_test_split
+
+    texts, categories = load_labelled_texts(path, limit)
+    X = encode(texts)
+    y = np.asarray(categories)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, stratify=y, random_state=42)
+
+    # Fair comparison: refit the ensemble (same hyperparameters) on the same split.
+    print("🧠 Fitting ensemble on the training split...")
+    ensemble = clone(joblib.load("model/classifier.pkl")).fit(X_train, y_train)
+    models = {"ensemble": ensemble, f"knn (k={k})": KnnClassifier.from_labelled(X_train, y_train, k=k)}
+    if ann:
+        models[f"knn-hnsw (k={k})"] = KnnClassifier.from_labelled(X_train, y_train, k=k, ann=True)
+
+    print(f"{'model':<18} {'accuracy':>9} {'batch ms/1k':>12} {'single ms':>10}")
+    for name, model in models.items():
+        start = time.perf_counter()
+        accuracy = float(np.mean(model.predict(X_test) == y_test))
+        batch_ms = (time.perf_counter() - start) * 1000 / len(X_test) * 1000
+        start = time.perf_counter()
+        for row in X_test[:200]:
+            model.predict_proba(row.reshape(1, -1))
+        single_ms = (time.perf_counter() - start) * 1000 / min(200, len(X_test))
+        print(f"{name:<18} {accuracy*100:>8.2f}% {batch_ms:>12.2f} {single_ms:>10.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Nearest-neighbour category index over training embeddings.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_build = sub.add_parser("build", help="encode a labelled CSV and save the index")
+    p_build.add_argument("csv", nargs="?", default="synthetic_data.csv")
+    p_build.add_argument("--limit", type=int)
+    p_add = sub.add_parser("add", help="append new labelled rows to the saved index (no retraining)")
+    p_add.add_argument("csv", nargs="+")
+    p_bench = sub.add_parser("benchmark", help="compare accuracy and latency against the ensemble")
+    p_bench.add_argument("csv", nargs="?", default="synthetic_data.csv")
+    p_bench.add_argument("--k", type=int, default=10)
+    p_bench.add_argument("--limit", type=int)
+    p_bench.add_argument("--ann", action="store_true", help="also benchmark the faiss HNSW index")
+    for p in (p_build, p_add):
+        p.add_argument("--out", default=KNN_DIR)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build(args.csv, args.out, args.limit)
+    elif args.command == "add":
+        extend(args.csv, args.out)
+    else:
+        benchmark(args.csv, args.k, args.limit, ann=args.ann)
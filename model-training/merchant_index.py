@@ -0,0 +1,156 @@
+import os
+import re
+import sys
+import json
+import difflib
+import argparse
+from collections import Counter, defaultdict
+
+MERCHANT_INDEX_PATH = "model/merchant_index.json"
+
+# Words that say how a merchant was paid, not who it was.
+NOISE_TOKENS = {
+    "txn", "bill", "payment", "online", "upi", "paid", "to", "received", "from",
+    "pvt", "private", "ltd", "limited", "llp", "inc",
+}
+
+
+# ----- Utility: Merchant Key Normalization -----
+def merchant_key(description):
+    text = str(description).lower()
+    text = re.sub(r'#\S*', ' ', text)          # reference numbers like "#9642"
+    text = re.sub(r'[^a-z0-9&\- ]+', ' ', text)
+    tokens = [t for t in text.split() if t not in NOISE_TOKENS and not t.isdigit()]
+    return " ".join(tokens)
+
+
+class MerchantIndex:
+    """Merchant -> category lookup: exact hash, token-prefix trie, optional fuzzy match.
+
+    Every entry carries its purity (share of labelled rows with that category),
+    which is reported as the confidence of a lookup.
+    """
+
+    def __init__(self, merchants, min_confidence=0.6, fuzzy=False, fuzzy_cutoff=0.9):
+        # merchants: {key: (category, purity, count)}
+        self.merchants = merchants
+        self.min_confidence = min_confidence
+        self.fuzzy = fuzzy
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self._trie = {}
+        self._buckets = defaultdict(list)
+        for key in merchants:
+            node = self._trie
+            for token in key.split():
+                node = node.setdefault(token, {})
+            node[None] = key
+            self._buckets[key[0]].append(key)
+
+    def __len__(self):
+        return len(self.merchants)
+
+    def lookup(self, description):
+        """Return (category, confidence, source) or None when the model should decide."""
+        key = merchant_key(description)
+        if not key:
+            return None
+
+        entry = self.merchants.get(key)
+        if entry is not None:
+            return self._accept(entry[0], entry[1], "merchant_exact")
+
+        # Longest known merchant that the description starts with, e.g.
+        # "swiggy instamart koramangala" -> "swiggy instamart". Confidence is
+        # scaled by how much of the description the merchant covers.
+        tokens = key.split()
+        node, matched = self._trie, None
+        for depth, token in enumerate(tokens, start=1):
+            node = node.get(token)
+            if node is None:
+                break
+            if None in node:
+                matched = (node[None], depth)
+        if matched is not None:
+            category, purity, _ = self.merchants[matched[0]]
+            result = self._accept(category, purity * matched[1] / len(tokens), "merchant_prefix")
+            if result is not None:
+                return result
+
+        if self.fuzzy:
+            close = difflib.get_close_matches(key, self._buckets.get(key[0], []), n=1, cutoff=self.fuzzy_cutoff)
+            if close:
+                category, purity, _ = self.merchants[close[0]]
+                ratio = difflib.SequenceMatcher(None, key, close[0]).ratio()
+                return self._accept(category, purity * ratio, "merchant_fuzzy")
+        return None
+
+    def _accept(self, category, confidence, source):
+        if confidence < self.min_confidence:
+            return None
+        return category, confidence, source
+
+    # ----- Persistence -----
+    def save(self, path=MERCHANT_INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"version": 1, "merchants": self.merchants}, f, indent=1, sort_keys=True)
+
+    @classmethod
+    def load(cls, path=MERCHANT_INDEX_PATH, **kwargs):
+        with open(path) as f:
+            saved = json.load(f)
+        merchants = {key: tuple(entry) for key, entry in saved["merchants"].items()}
+        return cls(merchants, **kwargs)
+
+
+# ----- Step: Build the Index from Labelled Transactions -----
+def read_labelled(path, min_confidence=0.0):
+    # CSV (synthetic_data.csv, exported corrections) or NDJSON (e.g. the output
+    # of /bulk_predict_stream); needs "description" and "category" fields and
+    # optionally "confidence" to keep only confident predictions.
+    import pandas as pd
+
+    if path.endswith((".ndjson", ".jsonl")):
+        df = pd.read_json(path, lines=True)
+    else:
+        df = pd.read_csv(path)
+    if "confidence" in df and min_confidence > 0:
+        df = df[df["confidence"] >= min_confidence]
+    df = df[df["category"] != "Other"]
+    return zip(df["description"].astype(str), df["category"].astype(str))
+
+
+def build_index(paths, min_count=3, min_purity=0.95, min_confidence=0.95):
+    counts = defaultdict(Counter)
+    for path in paths:
+        for description, category in read_labelled(path, min_confidence=min_confidence):
+            key = merchant_key(description)
+            if key:
+                counts[key][category] += 1
+
+    merchants = {}
+    for key, by_category in counts.items():
+        total = sum(by_category.values())
+        category, top = by_category.most_common(1)[0]
+        # Only merchants whose category never (or almost never) changes.
+        if total >= min_count and top / total >= min_purity:
+            merchants[key] = (category, round(top / total, 4), total)
+    return merchants
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the merchant -> category fast-path index.")
+    parser.add_argument("inputs", nargs="*", default=["synthetic_data.csv"],
+                        help="labelled CSV/NDJSON files (default: synthetic_data.csv)")
+    parser.add_argument("--out", default=MERCHANT_INDEX_PATH)
+    parser.add_argument("--min-count", type=int, default=3, help="rows a merchant needs to be indexed")
+    parser.add_argument("--min-purity", type=float, default=0.95, help="share of rows that must agree on the category")
+    parser.add_argument("--min-confidence", type=float, default=0.95,
+                        help="for inputs with a confidence column, the minimum to count a prediction as confirmed")
+    args = parser.parse_args()
+
+    merchants = build_index(args.inputs, args.min_count, args.min_purity, args.min_confidence)
+    if not merchants:
+        sys.exit("❌ No merchants met the count/purity thresholds.")
+    MerchantIndex(merchants).save(args.out)
+    print(f"✅ Indexed {len(merchants)} merchants into {args.out}")
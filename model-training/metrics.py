@@ -0,0 +1,73 @@
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+# Prometheus metrics for server.py, served at GET /metrics. Under gunicorn
+# each worker has its own counters; set PROMETHEUS_MULTIPROC_DIR to an empty
+# directory and /metrics reports the sum over all workers instead of the one
+# that happened to answer the scrape.
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR", "")
+
+STAGES = ["parse_request", "merchant_lookup", "ngram", "encode", "predict_proba", "build_response"]
+
+STAGE_SECONDS = Histogram(
+    "categorizer_stage_seconds", "Time spent in each stage of a prediction request", ["stage"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+# request: rows per /bulk_predict call; model: rows per embed + classify call
+# (including micro-batches of /predict); encode: rows the embedding cache missed.
+BATCH_SIZE = Histogram(
+    "categorizer_batch_size", "Transactions per batch", ["batch"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384),
+)
+# Rows answered by each tier of the cascade: merchant, ngram, model.
+TIER_ROWS = Counter("categorizer_tier_rows", "Transactions answered by each cascade tier", ["tier"])
+MODEL_LOAD_SECONDS = Gauge("categorizer_model_load_seconds", "Time the last model load took",
+                           multiprocess_mode="max")
+# Set once per worker, when its first model route answers 200.
+TIME_TO_FIRST_PREDICTION_SECONDS = Gauge("categorizer_time_to_first_prediction_seconds",
+                                         "Time from process start to the first successful prediction",
+                                         multiprocess_mode="max")
+MEMORY_BYTES = Gauge("categorizer_memory_bytes", "Worker memory from /proc/self/smaps_rollup (at scrape time)",
+                     ["kind"], multiprocess_mode="all")
+
+# Label lookups resolved once; observe() is then a lock and two additions.
+_stage_timers = {name: STAGE_SECONDS.labels(name) for name in STAGES}
+_batch_sizes = {name: BATCH_SIZE.labels(name) for name in ("request", "model", "encode")}
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stage_timers[name].observe(time.perf_counter() - start)
+
+
+def observe_batch(name, size):
+    _batch_sizes[name].observe(size)
+
+
+def count_tier(tier, rows):
+    TIER_ROWS.labels(tier).inc(rows)
+
+
+def render(memory_mb=None):
+    """(body, content type) of the Prometheus text exposition."""
+    for kind, value in (memory_mb or {}).items():
+        MEMORY_BYTES.labels(kind.replace("_mb", "")).set(value * 1024 * 1024)
+    registry = REGISTRY
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_worker_dead(pid):
+    # gunicorn child_exit hook: drop the dead worker's live gauges.
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,119 @@
+import os
+
+import numpy as np
+
+from text_prep import normalize_text
+
+NGRAM_PATH = "model/ngram.npz"
+# Character n-gram lengths hashed into the feature space.
+NGRAM_SIZES = (2, 3, 4, 5)
+HASH_BITS = 18
+# Default cascade gate: rows at least this confident are answered by this tier.
+NGRAM_MIN_CONFIDENCE = 0.9
+
+_MULTIPLIER = np.uint32(0x01000193)   # FNV prime, rolling polynomial hash
+_SCRAMBLE = np.uint32(0x9E3779B1)     # Fibonacci hashing into HASH_BITS buckets
+
+
+def ngram_text(description, tx_type="Debit"):
+    # The description as the embedder sees it plus the type; the amount is left
+    # out, its digits would only add noise n-grams.
+    return f"{normalize_text(description)} | {str(tx_type).lower()}"
+
+
+def ngram_texts(df):
+    """Vectorized ngram_text() over the Description/Type columns."""
+    desc = df["Description"].astype(str).str.lower().str.strip().str.replace(r'\s+', ' ', regex=True)
+    return (desc + " | " + df["Type"].astype(str).str.lower()).tolist()
+
+
+def hash_ngrams(texts, bits=HASH_BITS):
+    """(rows, columns, values) of the hashed n-gram counts, l2-scaled per row.
+
+    All texts are hashed at once: they are joined into one byte buffer, every
+    window is hashed with numpy, and windows that span two texts are dropped.
+    Entries are ordered by row.
+    """
+    buf = np.frombuffer("\0".join(f" {t} " for t in texts).encode(), dtype=np.uint8)
+    is_sep = buf == 0
+    sep_before = np.concatenate([[0], np.cumsum(is_sep)])  # separators in buf[:i]
+    byte = buf.astype(np.uint32)
+    n_pos = len(buf)
+    hashes = np.zeros((len(NGRAM_SIZES), n_pos), dtype=np.uint32)
+    valid = np.zeros((len(NGRAM_SIZES), n_pos), dtype=bool)
+    for k, n in enumerate(NGRAM_SIZES):
+        windows = n_pos - n + 1
+        if windows <= 0:
+            continue
+        h = np.full(windows, n, dtype=np.uint32)
+        for offset in range(n):
+            h = h * _MULTIPLIER + byte[offset:offset + windows]
+        hashes[k, :windows] = (h * _SCRAMBLE) >> np.uint32(32 - bits)
+        valid[k, :windows] = sep_before[n:n + windows] == sep_before[:windows]
+    # Position-major order keeps the entries of each text together.
+    hashes, valid = hashes.T.ravel(), valid.T.ravel()
+    rows = np.repeat(sep_before[:n_pos], len(NGRAM_SIZES))[valid]
+    columns = hashes[valid].astype(np.int64)
+    per_row = np.bincount(rows, minlength=len(texts))
+    values = 1.0 / np.sqrt(np.maximum(per_row, 1))[rows]
+    return rows, columns, values.astype(np.float32)
+
+
+class NgramClassifier:
+    """Linear model over hashed character n-grams of the raw description.
+
+    The first tier of the server's cascade: it answers the rows it is
+    confident about in microseconds, and only the rest pay for the embedder.
+    Serving needs numpy only; fitting uses scipy and scikit-learn.
+    """
+
+    def __init__(self, weights, bias, classes):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.classes_ = np.asarray(classes)
+        self.bits = int(np.log2(self.weights.shape[0]))
+
+    def predict_proba(self, texts):
+        rows, columns, values = hash_ngrams(texts, self.bits)
+        logits = np.zeros((len(texts), len(self.bias)), dtype=np.float32)
+        if len(rows):
+            # Entries are grouped by row: one reduceat sums each text's weight rows.
+            starts = np.searchsorted(rows, np.arange(len(texts)))
+            present = np.bincount(rows, minlength=len(texts)) > 0
+            sums = np.add.reduceat(self.weights[columns] * values[:, None], np.minimum(starts, len(rows) - 1))
+            logits[present] = sums[present]
+        logits += self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        proba = np.exp(logits)
+        return proba / proba.sum(axis=1, keepdims=True)
+
+    def predict(self, texts):
+        return self.classes_[np.argmax(self.predict_proba(texts), axis=1)]
+
+    @classmethod
+    def fit(cls, texts, y, C=10.0, bits=HASH_BITS):
+        from scipy.sparse import csr_matrix
+        from sklearn.linear_model import LogisticRegression
+
+        rows, columns, values = hash_ngrams(texts, bits)
+        X = csr_matrix((values, (rows, columns)), shape=(len(texts), 2 ** bits))
+        model = LogisticRegression(C=C, max_iter=1000).fit(X, np.asarray(y))
+        coef, intercept = model.coef_, model.intercept_
+        if len(model.classes_) == 2:  # binary: one coefficient row for the second class
+            coef, intercept = np.vstack([-coef, coef]) / 2, np.concatenate([-intercept, intercept]) / 2
+        return cls(coef.T, intercept, model.classes_)
+
+    # ----- Persistence -----
+    def save(self, path=NGRAM_PATH):
+        # Written beside the target and renamed over it: running servers reload it.
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, weights=self.weights, bias=self.bias, classes=self.classes_.astype(str))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=NGRAM_PATH):
+        with np.load(path, allow_pickle=False) as saved:
+            return cls(saved["weights"], saved["bias"], saved["classes"])
+
+    def size_bytes(self):
+        return self.weights.nbytes + self.bias.nbytes
@@ -0,0 +1,197 @@
+import os
+import copy
+import json
+
+import numpy as np
+
+ONNX_DIR = "model/onnx"
+EMBEDDER_ONNX = "embedder.onnx"
+EMBEDDER_INT8_ONNX = "embedder-int8.onnx"
+CLASSIFIER_ONNX = "classifier.onnx"
+CLASSES_JSON = "classes.json"
+
+# Parity with the PyTorch/sklearn path, checked on every export:
+#   fp32 embedder: identical categories, confidences within 1e-3
+#   int8 embedder: >= 98% identical categories, confidences within 0.05
+TOLERANCES = {
+    "fp32": {"max_confidence_diff": 1e-3, "min_category_agreement": 1.0},
+    "int8": {"max_confidence_diff": 0.05, "min_category_agreement": 0.98},
+}
+
+
+# ----- Runtime: ONNX Runtime drop-ins for SentenceTransformer / VotingClassifier -----
+def _session(path, threads=0):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads:
+        options.intra_op_num_threads = threads
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+class OnnxEmbedder:
+    """Tokenizer + ONNX transformer + mean pooling + L2 normalize, like model/embedder."""
+
+    def __init__(self, model_path, tokenizer_path, max_length=256, batch_size=64, threads=0):
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+        self.session = _session(model_path, threads)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.batch_size = batch_size
+
+    def encode(self, texts, batch_size=None, **_):
+        batch_size = batch_size or self.batch_size
+        out = [self._encode_batch(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+        if not out:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.concatenate(out)
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(list(texts))
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        token_embeddings = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+
+class OnnxClassifier:
+    """predict_proba()/classes_ over the exported ensemble, without sklearn or xgboost."""
+
+    def __init__(self, model_path, classes_path, threads=0):
+        self.session = _session(model_path, threads)
+        self.input_name = self.session.get_inputs()[0].name
+        # Outputs are (label, probabilities); probabilities follow classes_ order.
+        self.proba_name = self.session.get_outputs()[1].name
+        with open(classes_path) as f:
+            self.classes_ = np.array(json.load(f))
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        return self.session.run([self.proba_name], {self.input_name: X})[0]
+
+
+def load_onnx_models(onnx_dir=ONNX_DIR, tokenizer_path="model/embedder/tokenizer.json", quantized=False, threads=0):
+    embedder_file = EMBEDDER_INT8_ONNX if quantized else EMBEDDER_ONNX
+    embedder = OnnxEmbedder(os.path.join(onnx_dir, embedder_file), tokenizer_path, threads=threads)
+    clf = OnnxClassifier(os.path.join(onnx_dir, CLASSIFIER_ONNX), os.path.join(onnx_dir, CLASSES_JSON), threads=threads)
+    return embedder, clf
+
+
+# ----- Export: used by train_model.py --onnx -----
+def export_embedder(embedder, out_path, opset=14):
+    import torch
+
+    transformer = embedder[0].auto_model.eval()
+    tokenizer = embedder.tokenizer
+    dummy = tokenizer(["paid to swiggy | debit"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["token_embeddings"] = {0: "batch", 1: "sequence"}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(dummy[name] for name in input_names),
+            out_path,
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+
+
+def quantize_embedder(in_path, out_path):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(in_path, out_path, weight_type=QuantType.QInt8)
+
+
+def export_classifier(clf, dim, out_path):
+    import xgboost as xgb
+    from onnxmltools.convert.xgboost.operator_converters.XGBoost import convert_xgboost
+    from skl2onnx import convert_sklearn, update_registered_converter
+    from skl2onnx.common.data_types import FloatTensorType
+    from skl2onnx.common.shape_calculator import calculate_linear_classifier_output_shapes
+
+    # skl2onnx handles the VotingClassifier and LogisticRegression; onnxmltools the XGBoost half.
+    update_registered_converter(
+        xgb.XGBClassifier,
+        "XGBoostXGBClassifier",
+        calculate_linear_classifier_output_shapes,
+        convert_xgboost,
+        options={"nocl": [True, False], "zipmap": [True, False, "columns"]},
+    )
+    # flatten_transform only affects transform(), which skl2onnx does not support; predict_proba is unchanged.
+    clf = copy.copy(clf)
+    if hasattr(clf, "flatten_transform"):
+        clf.flatten_transform = False
+    onx = convert_sklearn(
+        clf,
+        initial_types=[("input", FloatTensorType([None, dim]))],
+        options={id(clf): {"zipmap": False}},
+        target_opset={"": 15, "ai.onnx.ml": 3},
+    )
+    with open(out_path, "wb") as f:
+        f.write(onx.SerializeToString())
+
+
+def check_parity(embedder, clf, onnx_embedder, onnx_clf, sample_texts, tolerance):
+    ref = clf.predict_proba(embedder.encode(sample_texts))
+    got = onnx_clf.predict_proba(onnx_embedder.encode(sample_texts))
+    ref_idx, got_idx = ref.argmax(axis=1), got.argmax(axis=1)
+    report = {
+        "samples": len(sample_texts),
+        "category_agreement": float(np.mean(clf.classes_[ref_idx] == onnx_clf.classes_[got_idx])),
+        "max_confidence_diff": float(np.max(np.abs(ref.max(axis=1) - got.max(axis=1)))),
+        "max_proba_diff": float(np.max(np.abs(ref - got))),
+    }
+    report["ok"] = (
+        report["category_agreement"] >= tolerance["min_category_agreement"]
+        and report["max_confidence_diff"] <= tolerance["max_confidence_diff"]
+    )
+    return report
+
+
+def export_onnx(embedder, clf, sample_texts, out_dir=ONNX_DIR, quantize=False,
+                tokenizer_path="model/embedder/tokenizer.json"):
+    os.makedirs(out_dir, exist_ok=True)
+
+    print("📦 Exporting embedder to ONNX...")
+    export_embedder(embedder, os.path.join(out_dir, EMBEDDER_ONNX))
+    if quantize:
+        print("📦 Quantizing embedder to int8...")
+        quantize_embedder(os.path.join(out_dir, EMBEDDER_ONNX), os.path.join(out_dir, EMBEDDER_INT8_ONNX))
+
+    print("📦 Exporting classifier to ONNX...")
+    dim = embedder.get_sentence_embedding_dimension()
+    export_classifier(clf, dim, os.path.join(out_dir, CLASSIFIER_ONNX))
+    with open(os.path.join(out_dir, CLASSES_JSON), "w") as f:
+        json.dump([str(c) for c in clf.classes_], f)
+
+    reports = {}
+    for variant in (["fp32", "int8"] if quantize else ["fp32"]):
+        onnx_embedder, onnx_clf = load_onnx_models(out_dir, tokenizer_path, quantized=(variant == "int8"))
+        report = check_parity(embedder, clf, onnx_embedder, onnx_clf, sample_texts, TOLERANCES[variant])
+        status = "✅" if report["ok"] else "❌"
+        print(f"{status} ONNX {variant} parity: {report['category_agreement']*100:.2f}% same category, "
+              f"max confidence diff {report['max_confidence_diff']:.5f}")
+        reports[variant] = report
+
+    with open(os.path.join(out_dir, "parity.json"), "w") as f:
+        json.dump({"tolerances": TOLERANCES, "reports": reports}, f, indent=2)
+
+    failed = [v for v, r in reports.items() if not r["ok"]]
+    if failed:
+        raise ValueError(f"ONNX export outside tolerance for: {', '.join(failed)} (see {out_dir}/parity.json)")
+    return reports
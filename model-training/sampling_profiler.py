@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+# Wall-clock sampling profiler for production: every interval it records the
+# Python stack of each thread, and identical stacks are counted. The output
+# is the collapsed-stack format flamegraph.pl and speedscope read. Nothing
+# runs until a profile is requested, so it costs nothing when idle.
+# The same file lives in model-training/ and backend/ (separate images).
+
+# Top frames of threads that are waiting rather than working (gthread / uvicorn
+# idle threads, the micro-batcher's condition variable); not worth a sample.
+IDLE_FRAMES = {"wait", "select", "poll", "accept", "_worker"}
+MAX_SECONDS = 60
+
+_busy = threading.Lock()
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds, interval=0.005, include_idle=False):
+    """Counter of collapsed stacks ("outer;...;inner") sampled for the given time."""
+    counts = Counter()
+    me = threading.get_ident()
+    deadline = time.monotonic() + min(seconds, MAX_SECONDS)
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me or (not include_idle and frame.f_code.co_name in IDLE_FRAMES):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return counts
+
+
+def profile(seconds, interval=0.005, include_idle=False):
+    """Collapsed stacks as text, most frequent first; None if a profile is already running."""
+    if not _busy.acquire(blocking=False):
+        return None
+    try:
+        counts = sample_stacks(seconds, interval, include_idle)
+    finally:
+        _busy.release()
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
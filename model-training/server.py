@@ -1,45 +1,499 @@
 
 
-from flask import Flask, request, jsonify
-import joblib
-import numpy as np
-from sentence_transformers import SentenceTransformer
+import os
+import time
+import atexit
+import threading
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
+from embedding_cache import EmbeddingCache, embedder_fingerprint
+from batcher import MicroBatcher
+from merchant_index import MerchantIndex
+from text_prep import build_input_text
+from distill import DISTILLED_PATH, DistilledClassifier
+from ngram_classifier import NGRAM_MIN_CONFIDENCE as DEFAULT_NGRAM_MIN_CONFIDENCE, NGRAM_PATH, NgramClassifier, ngram_text
+import cascade
+import metrics
+import sampling_profiler
+import wire_format
 
-print("🚀 Loading model...")
-clf = joblib.load("model/classifier.pkl")
-embedder = SentenceTransformer("model/embedder")
+EMBEDDER_PATH = "model/embedder"
+# "pytorch" serves model/classifier.pkl + model/embedder; "onnx" serves the
+# exports from `python train_model.py --onnx` through ONNX Runtime.
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "pytorch").lower()
+# With the onnx backend, use the int8-quantized embedder (needs --quantize at export).
+ONNX_QUANTIZED = os.environ.get("ONNX_QUANTIZED", "0") == "1"
+# "distilled" uses the single linear model train_model.py distills from the
+# ensemble (falling back to the ensemble until it exists); "ensemble" uses the
+# VotingClassifier; "knn" votes over the nearest training embeddings saved by
+# `python knn_index.py build`.
+CLASSIFIER_MODE = os.environ.get("CLASSIFIER_MODE", "distilled").lower()
+KNN_K = int(os.environ.get("KNN_K", "10"))
+# With knn, search a faiss HNSW index instead of exact brute force.
+KNN_ANN = os.environ.get("KNN_ANN", "0") == "1"
+# Seconds between checks for a retrained classifier on disk (0 disables hot reload).
+MODEL_RELOAD_INTERVAL = float(os.environ.get("MODEL_RELOAD_INTERVAL", "10"))
+# Number of distinct descriptions to keep embeddings for (0 disables the cache).
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "50000"))
+# Optional .npz file used to keep the cache across gunicorn restarts.
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "")
+# Concurrent /predict calls are coalesced into batches of up to this size...
+MICRO_BATCH_MAX_SIZE = int(os.environ.get("MICRO_BATCH_MAX_SIZE", "32"))
+# ...waiting at most this long for the batch to fill (0 disables micro-batching).
+MICRO_BATCH_MAX_WAIT_MS = float(os.environ.get("MICRO_BATCH_MAX_WAIT_MS", "5"))
+# Rows encoded and classified per step by /bulk_predict_stream.
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", "256"))
+# Merchant -> category index consulted before the model ("" disables the fast path).
+MERCHANT_INDEX_PATH = os.environ.get("MERCHANT_INDEX_PATH", "model/merchant_index.json")
+# Lowest lookup confidence (category purity x share of the description matched) served without the model.
+MERCHANT_MIN_CONFIDENCE = float(os.environ.get("MERCHANT_MIN_CONFIDENCE", "0.6"))
+# Also try approximate matches (difflib) when exact and prefix lookups miss.
+MERCHANT_FUZZY = os.environ.get("MERCHANT_FUZZY", "0") == "1"
+# Character n-gram model trained by train_model.py, tried after the merchant
+# index and before the embedder ("" disables the cascade).
+NGRAM_MODEL_PATH = os.environ.get("NGRAM_MODEL_PATH", NGRAM_PATH)
+# Lowest n-gram confidence answered without the embedder; less sure rows fall through.
+NGRAM_MIN_CONFIDENCE = float(os.environ.get("NGRAM_MIN_CONFIDENCE", DEFAULT_NGRAM_MIN_CONFIDENCE))
+# Load the models in a background thread instead of at import: the server
+# answers "/" at once and model routes wait for the warm-up (scale-to-zero).
+LAZY_LOAD = os.environ.get("LAZY_LOAD", "0") == "1"
+# How long a model route waits for warm-up before answering 503.
+WARMUP_WAIT_S = float(os.environ.get("WARMUP_WAIT_S", "60"))
+# A failed warm-up is retried after this many seconds, doubling up to WARMUP_RETRY_MAX_S.
+WARMUP_RETRY_S = float(os.environ.get("WARMUP_RETRY_S", "5"))
+WARMUP_RETRY_MAX_S = float(os.environ.get("WARMUP_RETRY_MAX_S", "300"))
+# Expose GET /debug/profile (sampled stacks of the running worker).
+PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED", "0") == "1"
+
+
+def classifier_mode():
+    if CLASSIFIER_MODE == "distilled" and not os.path.exists(DISTILLED_PATH):
+        return "ensemble"
+    return CLASSIFIER_MODE
+
+
+def load_classifier():
+    # Just the classifier; the embedder (and so the embedding cache) stays valid.
+    mode = classifier_mode()
+    if mode == "knn":
+        from knn_index import KnnClassifier
+        return KnnClassifier.load(k=KNN_K, ann=KNN_ANN)
+    if mode == "distilled":
+        return DistilledClassifier.load(DISTILLED_PATH)
+    import joblib
+    # Memory-map the numpy arrays instead of copying them into the heap; the
+    # pickle is written uncompressed by train_model.py, which allows it.
+    return joblib.load("model/classifier.pkl", mmap_mode="r")
+
+
+def classifier_artifact():
+    # File whose mtime changes when the classifier is retrained (written last).
+    return {"knn": "model/knn/classes.json", "distilled": DISTILLED_PATH}.get(classifier_mode(), "model/classifier.pkl")
+
+
+def artifact_mtime():
+    try:
+        return os.stat(classifier_artifact()).st_mtime
+    except OSError:
+        return None
+
+
+def load_models(threads=0):
+    # Returns (embedder, clf) for the configured backend and classifier mode.
+    if INFERENCE_BACKEND == "onnx":
+        from onnx_backend import load_onnx_models
+        embedder, clf = load_onnx_models(tokenizer_path=os.path.join(EMBEDDER_PATH, "tokenizer.json"),
+                                         quantized=ONNX_QUANTIZED, threads=threads)
+        if classifier_mode() != "ensemble":
+            clf = load_classifier()
+        return embedder, clf
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDER_PATH), load_classifier()
+
+
+def process_start_time():
+    # Wall-clock start of the process importing this module (with preload, the
+    # gunicorn master), so interpreter start-up and imports count towards
+    # time-to-first-prediction.
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+embedder = clf = None
+_loaded_mtime = None
+MODEL_LOAD_SECONDS = None
+WARMUP_SECONDS = None
+TIME_TO_FIRST_PREDICTION = None
+models_ready = threading.Event()
+# Last warm-up error, until a retry succeeds; model routes answer 503 at once meanwhile.
+WARMUP_ERROR = None
+_next_warmup_attempt = None
+# Notified when a warm-up attempt finishes, either way.
+_warmup_state = threading.Condition()
+_warmup_pid = None
+
+
+def load_all(threads=0):
+    global embedder, clf, _loaded_mtime, MODEL_LOAD_SECONDS
+    print(f"🚀 Loading model ({INFERENCE_BACKEND} backend, {classifier_mode()} classifier)...")
+    start = time.perf_counter()
+    _loaded_mtime = artifact_mtime()
+    embedder, clf = load_models(threads=threads)
+    MODEL_LOAD_SECONDS = time.perf_counter() - start
+    metrics.MODEL_LOAD_SECONDS.set(MODEL_LOAD_SECONDS)
+    print(f"✅ Model loaded in {MODEL_LOAD_SECONDS:.2f}s")
+
+
+def warm_up(threads=0):
+    # Load, then run one inference so lazy initialisation inside torch /
+    # ONNX Runtime happens here and not in the first user's request.
+    global WARMUP_SECONDS, WARMUP_ERROR, _next_warmup_attempt
+    start = time.perf_counter()
+    delay = WARMUP_RETRY_S
+    while True:
+        try:
+            if threads and INFERENCE_BACKEND != "onnx":
+                import torch
+                torch.set_num_threads(threads)
+            load_all(threads)
+            classify(embedder.encode([build_input_text("warm up", "Debit", 0)]))
+            break
+        except Exception as e:
+            with _warmup_state:
+                WARMUP_ERROR = f"{type(e).__name__}: {e}"
+                _next_warmup_attempt = time.monotonic() + delay
+                _warmup_state.notify_all()
+            print(f"❌ Model warm-up failed, retrying in {delay:.0f}s: {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, WARMUP_RETRY_MAX_S)
+    WARMUP_SECONDS = time.perf_counter() - start
+    with _warmup_state:
+        WARMUP_ERROR = None
+        models_ready.set()
+        _warmup_state.notify_all()
+    print(f"🔥 Warm-up done in {WARMUP_SECONDS:.2f}s")
+
+
+def start_warm_up(threads=0):
+    # Once per process; threads don't survive a fork, so each worker starts its own.
+    global _warmup_pid
+    if _warmup_pid == os.getpid():
+        return
+    _warmup_pid = os.getpid()
+    threading.Thread(target=warm_up, args=(threads,), name="model-warmup", daemon=True).start()
+
+
+PROCESS_START = process_start_time()
+if not LAZY_LOAD:
+    load_all()
+    models_ready.set()
+
+merchant_index = None
+if MERCHANT_INDEX_PATH and os.path.exists(MERCHANT_INDEX_PATH):
+    merchant_index = MerchantIndex.load(MERCHANT_INDEX_PATH, min_confidence=MERCHANT_MIN_CONFIDENCE,
+                                        fuzzy=MERCHANT_FUZZY)
+    print(f"✅ Loaded {len(merchant_index)} merchants for the fast path")
+
+
+def ngram_mtime():
+    try:
+        return os.stat(NGRAM_MODEL_PATH).st_mtime if NGRAM_MODEL_PATH else None
+    except OSError:
+        return None
+
+
+def load_ngram():
+    if not NGRAM_MODEL_PATH or not os.path.exists(NGRAM_MODEL_PATH):
+        return None
+    return NgramClassifier.load(NGRAM_MODEL_PATH)
+
+
+_ngram_mtime = ngram_mtime()
+ngram_clf = load_ngram()
+if ngram_clf is not None:
+    print(f"✅ Loaded n-gram first tier ({ngram_clf.size_bytes() / 1e6:.1f} MB)")
+
+
+_next_reload_check = time.monotonic() + MODEL_RELOAD_INTERVAL
+
+
+def reload_ngram(force=False):
+    # The n-gram tier has its own file and mtime: `train_model.py --ngram-only`
+    # rewrites just that file, and a deleted file switches the tier off.
+    global ngram_clf, _ngram_mtime
+    mtime = ngram_mtime()
+    if mtime == _ngram_mtime and not force:
+        return False
+    ngram_clf, _ngram_mtime = load_ngram(), mtime
+    print(f"🔄 Reloaded n-gram tier from {NGRAM_MODEL_PATH}" if ngram_clf is not None else "🔄 N-gram tier removed")
+    return True
+
+
+def reload_classifier(force=False):
+    # Swap in a retrained classifier. Requests already running keep the old object.
+    global clf, _loaded_mtime
+    mtime = artifact_mtime()
+    if mtime is None or (mtime == _loaded_mtime and not force):
+        return False
+    new_clf = load_classifier()
+    clf, _loaded_mtime = new_clf, mtime
+    print(f"🔄 Reloaded classifier from {classifier_artifact()}")
+    return True
+
+
+def worker_init(threads):
+    # Called by gunicorn.conf.py in each worker right after fork.
+    global embedder, clf
+    if LAZY_LOAD:
+        start_warm_up(threads)
+        return
+    if INFERENCE_BACKEND == "onnx":
+        # ONNX Runtime sessions are not fork-safe; each worker opens its own.
+        embedder, clf = load_models(threads=threads)
+    else:
+        import torch
+        # Split the cores between workers instead of every worker using all of them.
+        torch.set_num_threads(threads)
+
+
+embedding_cache = EmbeddingCache(
+    max_size=EMBEDDING_CACHE_SIZE,
+    path=EMBEDDING_CACHE_PATH or None,
+    # int8 vectors differ slightly from fp32 ones, so they get their own namespace.
+    namespace=embedder_fingerprint(EMBEDDER_PATH) + (":int8" if INFERENCE_BACKEND == "onnx" and ONNX_QUANTIZED else ""),
+)
+atexit.register(embedding_cache.save)
+
+
+def encode_misses(texts):
+    metrics.observe_batch("encode", len(texts))
+    with metrics.stage("encode"):
+        return embedder.encode(texts)
+
+
+def embed(input_texts):
+    # Only descriptions the cache has not seen go through the embedder.
+    return embedding_cache.encode(input_texts, encode_misses)
+
+
+def classify(embeddings):
+    # Returns (categories, confidences); low-confidence predictions become "Other".
+    model = clf  # one consistent model even if a reload swaps it mid-call
+    with metrics.stage("predict_proba"):
+        probas = model.predict_proba(embeddings)
+    return cascade.classify(probas, model.classes_)
+
+
+def model_input(txn):
+    # Same string train_model.py builds for the row, amount included.
+    return build_input_text(txn["description"], txn.get("transactionType", "Debit"), txn.get("amount"))
+
+
+def predict_model(transactions):
+    # (category, confidence, source) per transaction from the embedder + classifier.
+    metrics.observe_batch("model", len(transactions))
+    categories, confidences = classify(embed([model_input(txn) for txn in transactions]))
+    return [(category, confidence, "model") for category, confidence in zip(categories, confidences)]
+
+
+def lookup_merchant(txn):
+    if merchant_index is None:
+        return None
+    return merchant_index.lookup(txn["description"])
+
+
+def predict_ngram(transactions):
+    # (category, confidence, "ngram") per transaction, None where the n-gram
+    # model is less sure than NGRAM_MIN_CONFIDENCE.
+    model = ngram_clf
+    if model is None:
+        return [None] * len(transactions)
+    with metrics.stage("ngram"):
+        probas = model.predict_proba([ngram_text(txn["description"], txn.get("transactionType", "Debit"))
+                                      for txn in transactions])
+    return cascade.ngram_results(probas, model.classes_, NGRAM_MIN_CONFIDENCE)
+
+
+class TierStats:
+    """Rows answered by each tier of the cascade, in this worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}
+
+    def record(self, results):
+        counts = {}
+        for _, _, source in results:
+            tier = "merchant" if source.startswith("merchant") else source
+            counts[tier] = counts.get(tier, 0) + 1
+        with self._lock:
+            for tier, count in counts.items():
+                self._rows[tier] = self._rows.get(tier, 0) + count
+        for tier, count in counts.items():
+            metrics.count_tier(tier, count)
+
+    def stats(self):
+        with self._lock:
+            rows = dict(self._rows)
+        total = sum(rows.values())
+        return {
+            "rows": total,
+            "tiers": {tier: {"rows": count, "hit_rate": round(count / total, 4)} for tier, count in rows.items()},
+            "ngram_min_confidence": NGRAM_MIN_CONFIDENCE if ngram_clf is not None else None,
+        }
+
+
+tier_stats = TierStats()
+
+
+def predict_merchants(transactions):
+    with metrics.stage("merchant_lookup"):
+        return [lookup_merchant(txn) for txn in transactions]
+
+
+def predict_transactions(transactions):
+    # Known merchants, then the n-gram tier; only the rest reach the embedder.
+    results = cascade.run_cascade(transactions, predict_merchants,
+                                  predict_ngram if ngram_clf is not None else None, predict_model)
+    tier_stats.record(results)
+    return results
+
+
+# One embedder.encode + predict_proba per group of concurrent /predict calls.
+# Coalescing only happens when a worker serves requests concurrently (gthread).
+predict_batcher = MicroBatcher(
+    predict_model,
+    max_batch_size=MICRO_BATCH_MAX_SIZE,
+    max_wait_ms=MICRO_BATCH_MAX_WAIT_MS,
+)
+
+
+def predict_batched(transactions):
+    # A single /predict row; it reaches the model together with concurrent ones.
+    return [predict_batcher(txn) for txn in transactions]
+
+
+def predict_one(txn):
+    batched = MICRO_BATCH_MAX_WAIT_MS > 0 and MICRO_BATCH_MAX_SIZE > 1
+    result, = cascade.run_cascade([txn], predict_merchants, predict_ngram if ngram_clf is not None else None,
+                                  predict_batched if batched else predict_model)
+    tier_stats.record([result])
+    return result
 
 app = Flask(__name__)
 # This enables CORS for all routes and origins.
 CORS(app)
 
+# Routes that need the embedder and classifier; all but /reload answer predictions.
+PREDICTION_ENDPOINTS = {"predict", "bulk_predict", "bulk_predict_stream"}
+MODEL_ENDPOINTS = PREDICTION_ENDPOINTS | {"reload"}
+
+
+def warmup_failed_response():
+    retry_after = max(1, int(_next_warmup_attempt - time.monotonic() + 0.999))
+    return (jsonify({"error": f"Model failed to load ({WARMUP_ERROR}), retrying"}), 503,
+            {"Retry-After": str(retry_after)})
+
+
+@app.before_request
+def wait_for_models():
+    if request.endpoint not in MODEL_ENDPOINTS or models_ready.is_set():
+        return None
+    start_warm_up()  # no-op when gunicorn's post_fork already started it
+    # Waits for the warm-up, but not for the retries of a failed one: each
+    # waiting request holds a worker thread.
+    with _warmup_state:
+        if WARMUP_ERROR is None:
+            _warmup_state.wait_for(lambda: models_ready.is_set() or WARMUP_ERROR is not None, WARMUP_WAIT_S)
+        if models_ready.is_set():
+            return None
+        if WARMUP_ERROR is not None:
+            return warmup_failed_response()
+    return jsonify({"error": "Model is still loading, retry shortly"}), 503, {"Retry-After": "2"}
+
+
+@app.after_request
+def record_first_prediction(response):
+    global TIME_TO_FIRST_PREDICTION
+    if TIME_TO_FIRST_PREDICTION is None and request.endpoint in PREDICTION_ENDPOINTS and response.status_code == 200:
+        TIME_TO_FIRST_PREDICTION = time.time() - PROCESS_START
+        metrics.TIME_TO_FIRST_PREDICTION_SECONDS.set(TIME_TO_FIRST_PREDICTION)
+        print(f"⏱️ Time to first prediction: {TIME_TO_FIRST_PREDICTION:.2f}s")
+    return response
+
+
+@app.before_request
+def check_for_new_model():
+    # Every worker polls the artifacts, so `train_model.py --incremental` reaches
+    # all of them without a restart. ONNX exports need a restart; the n-gram
+    # tier is numpy only and reloads with either backend.
+    global _next_reload_check
+    if MODEL_RELOAD_INTERVAL <= 0 or time.monotonic() < _next_reload_check:
+        return
+    if not models_ready.is_set():
+        return  # still warming up
+    _next_reload_check = time.monotonic() + MODEL_RELOAD_INTERVAL
+    try:
+        reload_ngram()
+    except Exception as e:
+        print(f"⚠️ Keeping the current n-gram tier, reload failed: {e}")
+    if INFERENCE_BACKEND == "onnx":
+        return
+    try:
+        reload_classifier()
+    except Exception as e:
+        print(f"⚠️ Keeping the current classifier, reload failed: {e}")
+
+
+@app.route("/reload", methods=["POST"])
+def reload():
+    # Forces a reload in the worker that receives it (others follow on their next check).
+    if INFERENCE_BACKEND == "onnx":
+        return jsonify({"error": "Hot reload is not supported with the onnx backend"}), 400
+    try:
+        reloaded = reload_ngram(force=True) | reload_classifier(force=True)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"reloaded": reloaded, "artifact": classifier_artifact(),
+                    "ngram": NGRAM_MODEL_PATH if ngram_clf is not None else None})
+
+
+def has_description(txn):
+    # Descriptions must be non-empty strings; anything else is a 400, not a crash in the tiers.
+    return isinstance(txn, dict) and isinstance(txn.get("description"), str) and bool(txn["description"])
+
+
 @app.route("/predict", methods=["POST"])
 def predict():
-    data = request.get_json()
+    with metrics.stage("parse_request"):
+        data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
     # For single transaction, expecting keys: "description" and "transactionType"
     desc = data.get("description", "")
     tx_type = data.get("transactionType", "Debit")  # default to Debit if not provided
 
-    if not desc:
-        return jsonify({"error": "Missing description"}), 400
-
-    input_text = f"{desc} | {tx_type}"
-    vec = embedder.encode([input_text])
-    proba = clf.predict_proba(vec)[0]
-    confidence = float(np.max(proba))
-    category = clf.classes_[np.argmax(proba)]
+    if not has_description(data):
+        return jsonify({"error": "Missing description (must be a non-empty string)"}), 400
 
-    if confidence < 0.6:
-        category = "Other"
+    category, confidence, source = predict_one({"description": desc, "transactionType": tx_type,
+                                                 "amount": data.get("amount")})
 
     # Merge original data with prediction results
-    result = {
-        **data,
-        "category": category,
-        "confidence": round(confidence, 3)
-    }
-    return jsonify(result)
+    with metrics.stage("build_response"):
+        result = {
+            **data,
+            "category": category,
+            "confidence": round(confidence, 3),
+            "source": source
+        }
+        return jsonify(result)
 
 # @app.route("/bulk_predict", methods=["POST"])
 # def bulk_predict():
@@ -81,53 +535,183 @@ def predict():
 
 @app.route("/bulk_predict", methods=["POST"])
 def bulk_predict():
-    data = request.get_json()
-    # Expecting "transactions" key with a list of transaction objects
-    transactions = data.get("transactions", None)
+    # JSON or columnar MessagePack in (Content-Type) and out (Accept). With
+    # ?echo=0 only category/confidence/source columns come back, aligned with
+    # the input by index, instead of every input field plus the prediction.
+    in_format = wire_format.request_format(request.mimetype)
+    out_format = request.accept_mimetypes.best_match(wire_format.FORMATS, wire_format.JSON)
+    echo = request.args.get("echo", "1") != "0"
+    columns = None
+    with metrics.stage("parse_request"):
+        try:
+            if in_format == wire_format.MSGPACK:
+                columns = wire_format.decode_columns(request.get_data())
+                transactions = wire_format.columns_to_rows(columns)
+            else:
+                data = wire_format.loads_json(request.get_data())
+                # Expecting "transactions" key with a list of transaction objects
+                transactions = data.get("transactions", None) if isinstance(data, dict) else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
     if transactions is None or not isinstance(transactions, list):
         return jsonify({"error": "Expected a JSON list under key 'transactions'"}), 400
 
-    input_texts = []
     for txn in transactions:
-        desc = txn.get("description", "")
-        tx_type = txn.get("transactionType", "Debit")
-        if not desc:
-            return jsonify({"error": "Each transaction must include a 'description'"}), 400
-        input_texts.append(f"{desc} | {tx_type}")
+        if not has_description(txn):
+            return jsonify({"error": "Each transaction must include a 'description' string"}), 400
 
-    # Batch encode all transaction texts
-    embeddings = embedder.encode(input_texts)
-
-    # 🔒 Fix: Ensure embeddings is a proper 2D array
-    if len(embeddings) == 0:
+    if len(transactions) == 0:
         return jsonify({"error": "Empty input after encoding"}), 400
-    if isinstance(embeddings, np.ndarray) and embeddings.ndim == 1:
-        embeddings = embeddings.reshape(1, -1)
-
-    probas = clf.predict_proba(embeddings)
-    predictions = clf.classes_[np.argmax(probas, axis=1)]
-    confidences = np.max(probas, axis=1)
-
-    results = []
-    for i, txn in enumerate(transactions):
-        pred = predictions[i]
-        conf = float(confidences[i])
-        if conf < 0.6:
-            pred = "Other"
-        # Return all original fields plus prediction results
-        txn_result = {
-            **txn,
-            "category": pred,
-            "confidence": round(conf, 3)
-        }
-        results.append(txn_result)
+    metrics.observe_batch("request", len(transactions))
+
+    # Known merchants skip the model; the rest are encoded in one batch (cached ones are skipped)
+    predictions = predict_transactions(transactions)
+
+    with metrics.stage("build_response"):
+        if out_format == wire_format.MSGPACK or not echo:
+            result = wire_format.result_columns(predictions)
+            if echo:
+                result = {**(columns or wire_format.rows_to_columns(transactions)), **result}
+        else:
+            # Return all original fields plus prediction results
+            result = {"predictions": [
+                {**txn, "category": pred, "confidence": round(conf, 3), "source": source}
+                for txn, (pred, conf, source) in zip(transactions, predictions)
+            ]}
+        body, mimetype = wire_format.encode(result, out_format)
+        return Response(body, mimetype=mimetype)
+
+
+def categorize_chunk(chunk):
+    # chunk: (line_no, txn, error) tuples; rows keep their input order.
+    predictions = iter(predict_transactions([txn for _, txn, error in chunk if error is None]))
+    for line_no, txn, error in chunk:
+        if error is not None:
+            yield wire_format.dumps_json({"line": line_no, "error": error}) + b"\n"
+            continue
+        pred, conf, source = next(predictions)
+        yield wire_format.dumps_json({**txn, "category": pred, "confidence": round(conf, 3), "source": source}) + b"\n"
+
+
+@app.route("/bulk_predict_stream", methods=["POST"])
+def bulk_predict_stream():
+    # Body: NDJSON, one transaction object per line. Response: NDJSON, one
+    # result per input line, written as each chunk of BULK_CHUNK_SIZE is done.
+    # Bad lines produce {"line": n, "error": ...} instead of failing the stream.
+    stream = request.stream
+
+    def generate():
+        chunk = []
+        for line_no, raw in enumerate(stream, start=1):
+            raw = raw.strip()
+            if not raw:
+                continue
+            try:
+                txn = wire_format.loads_json(raw)
+            except ValueError:
+                chunk.append((line_no, None, "Invalid JSON"))
+            else:
+                if not has_description(txn):
+                    chunk.append((line_no, None, "Each transaction must include a 'description' string"))
+                else:
+                    chunk.append((line_no, txn, None))
+            if len(chunk) >= BULK_CHUNK_SIZE:
+                yield from categorize_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield from categorize_chunk(chunk)
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@app.route("/cache_stats", methods=["GET"])
+def cache_stats():
+    return jsonify(embedding_cache.stats())
 
-    return jsonify({"predictions": results})
+
+@app.route("/cascade_stats", methods=["GET"])
+def cascade_stats():
+    return jsonify(tier_stats.stats())
+
+
+@app.route("/batch_stats", methods=["GET"])
+def batch_stats():
+    return jsonify(predict_batcher.stats())
+
+
+def memory_usage_mb():
+    # Rss counts shared model pages in every worker; Pss splits them between the
+    # processes sharing them, so summing Pss over workers gives the real total.
+    usage = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    usage[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    except OSError:
+        import resource
+        return {"max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+    private = usage.get("Private_Clean", 0) + usage.get("Private_Dirty", 0)
+    shared = usage.get("Shared_Clean", 0) + usage.get("Shared_Dirty", 0)
+    return {
+        "rss_mb": round(usage.get("Rss", 0), 1),
+        "pss_mb": round(usage.get("Pss", 0), 1),
+        "private_mb": round(private, 1),
+        "shared_mb": round(shared, 1),
+    }
+
+
+@app.route("/worker_stats", methods=["GET"])
+def worker_stats():
+    return jsonify({
+        "pid": os.getpid(),
+        "backend": INFERENCE_BACKEND,
+        "classifier": classifier_mode(),
+        "ready": models_ready.is_set(),
+        "warmup_error": WARMUP_ERROR,
+        "model_load_seconds": round(MODEL_LOAD_SECONDS, 3) if MODEL_LOAD_SECONDS is not None else None,
+        "warmup_seconds": round(WARMUP_SECONDS, 3) if WARMUP_SECONDS is not None else None,
+        "time_to_first_prediction_seconds": (round(TIME_TO_FIRST_PREDICTION, 3)
+                                             if TIME_TO_FIRST_PREDICTION is not None else None),
+        **memory_usage_mb(),
+    })
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    body, content_type = metrics.render(memory_usage_mb())
+    return Response(body, content_type=content_type)
+
+
+@app.route("/debug/profile", methods=["GET"])
+def debug_profile():
+    # Opt-in: sampled stacks of this worker for ?seconds= (default 10), in
+    # collapsed-stack format for flamegraph.pl / speedscope.
+    if not PROFILER_ENABLED:
+        return jsonify({"error": "Set PROFILER_ENABLED=1 to allow profiling"}), 404
+    seconds = request.args.get("seconds", 10, type=float)
+    interval = request.args.get("interval_ms", 5, type=float) / 1000
+    stacks = sampling_profiler.profile(seconds, interval, include_idle=request.args.get("idle") == "1")
+    if stacks is None:
+        return jsonify({"error": "A profile is already running"}), 409
+    return Response(stacks, mimetype="text/plain")
 
 
 @app.route("/", methods=["GET"])
 def root():
+    # Liveness: answers even while the model is still loading.
     return jsonify({"message": "Bank Transaction Categorizer is running."})
 
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    # Readiness / startup probe: 200 once the model has loaded and run a warm-up inference.
+    if not models_ready.is_set():
+        return jsonify({"ready": False, "warmup_error": WARMUP_ERROR}), 503
+    return jsonify({"ready": True, "warmup_seconds": WARMUP_SECONDS, "model_load_seconds": MODEL_LOAD_SECONDS})
+
 if __name__ == "__main__":
+    if LAZY_LOAD:
+        start_warm_up()
     app.run(host="0.0.0.0", port=8080)
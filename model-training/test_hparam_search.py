@@ -0,0 +1,53 @@
+from hparam_search import halving_rungs
+
+
+def survivors(rungs, n_candidates, eta):
+    # Candidates each rung trains, replaying search(): every rung keeps the next rung's count.
+    trained, remaining = [], n_candidates
+    for i, (count, _) in enumerate(rungs):
+        assert count == remaining
+        trained.append(remaining)
+        if i < len(rungs) - 1:
+            remaining = min(remaining, rungs[i + 1][0])
+    return trained
+
+
+def check(n_candidates, max_rounds, eta):
+    rungs = halving_rungs(n_candidates, max_rounds, eta)
+    budgets = [rounds for _, rounds in rungs]
+    assert budgets == sorted(set(budgets)), f"budgets must strictly grow: {rungs}"
+    assert budgets[-1] == max_rounds
+    assert rungs[0][0] == n_candidates
+    counts = survivors(rungs, n_candidates, eta)
+    assert all(a > b for a, b in zip(counts, counts[1:]))
+    return rungs
+
+
+def test_single_candidate_or_plain_grid():
+    assert halving_rungs(1, 100, 3) == [(1, 100)]
+    assert halving_rungs(9, 100, 1) == [(9, 100)]
+
+
+def test_small_n_does_not_repeat_a_budget():
+    # ceil(log3(4)) + 1 = 3 rungs used to give budgets [10, 10, 20].
+    assert check(4, 20, 3) == [(4, 10), (1, 20)]
+    assert check(2, 100, 3) == [(2, 33), (1, 100)]
+
+
+def test_power_of_eta():
+    assert check(9, 100, 3) == [(9, 11), (3, 33), (1, 100)]
+    assert check(27, 100, 3) == [(27, 10), (9, 11), (3, 33), (1, 100)]
+
+
+def test_n_not_a_power_of_eta():
+    # Survivors follow the floor division search() applies: 10 -> 3 -> 1, 5 -> 2 -> 1.
+    assert check(10, 100, 3) == [(10, 11), (3, 33), (1, 100)]
+    assert check(5, 100, 2) == [(5, 25), (2, 50), (1, 100)]
+    assert check(100, 100, 3) == [(100, 10), (11, 11), (3, 33), (1, 100)]
+
+
+def test_budget_floor_merges_rungs():
+    assert check(9, 10, 3) == [(9, 10)]
+    for n in range(1, 60):
+        for eta in (2, 3, 4):
+            check(n, 30, eta)
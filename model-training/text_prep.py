@@ -0,0 +1,45 @@
+import re
+
+# Single source of the "<description> | <type> | amount: <amount>" strings the
+# embedder sees, used by train_model.py and server.py alike.
+
+# Columns as exported by the app (synthetic_data.csv, user corrections) -> names used in training.
+COLUMN_ALIASES = {"description": "Description", "transactionType": "Type", "amount": "Amount", "category": "Category"}
+
+
+# ----- Utility: Clean and Normalize Text -----
+def normalize_text(text):
+    # Lowercase and collapse whitespace
+    text = str(text).lower().strip()
+    text = re.sub(r'\s+', ' ', text)
+    return text
+
+
+def format_amount(amount):
+    # Matches pandas' rendering of a float column: 50 -> "50.0", 123.86 -> "123.86".
+    try:
+        return str(float(amount))
+    except (TypeError, ValueError):
+        return "0.0"
+
+
+def build_input_text(description, tx_type="Debit", amount=None):
+    """One model input string, e.g. for a /predict request."""
+    return f"{normalize_text(description)} | {str(tx_type).lower()} | amount: {format_amount(amount)}"
+
+
+def build_input_texts(df):
+    """Vectorized build_input_text() over the Description/Type/Amount columns."""
+    desc = df["Description"].astype(str).str.lower().str.strip().str.replace(r'\s+', ' ', regex=True)
+    tx_type = df["Type"].astype(str).str.lower()
+    amount = df["Amount"].astype(float).astype(str)
+    return (desc + " | " + tx_type + " | amount: " + amount).tolist()
+
+
+def read_transactions(file_path, chunksize=None):
+    """Read a labelled CSV with canonical column names; with chunksize, an iterator of DataFrames."""
+    import pandas as pd
+
+    if chunksize:
+        return (chunk.rename(columns=COLUMN_ALIASES) for chunk in pd.read_csv(file_path, chunksize=chunksize))
+    return pd.read_csv(file_path).rename(columns=COLUMN_ALIASES)
@@ -1,83 +1,364 @@
 import os
+import time
+import pickle
+import argparse
+import numpy as np
 import pandas as pd
 import joblib
 from sentence_transformers import SentenceTransformer
-from sklearn.linear_model import LogisticRegression
-from sklearn.ensemble import VotingClassifier
-from sklearn.model_selection import GridSearchCV, cross_val_score
-import xgboost as xgb
-import re
-
-# ----- Utility: Clean and Normalize Text -----
-def normalize_text(text):
-    # Lowercase and collapse whitespace
-    text = text.lower().strip()
-    text = re.sub(r'\s+', ' ', text)
-    return text
+import hparam_search
+from embedding_store import encode_parallel, encode_with_store
+from text_prep import build_input_texts, read_transactions
+from ngram_classifier import NGRAM_MIN_CONFIDENCE, NGRAM_PATH, NgramClassifier, ngram_texts
+
+# Embeddings + labels of everything the saved model was trained on, so
+# incremental updates never re-encode old rows.
+TRAINING_SET_PATH = "model/training_set.npz"
+# Texts + labels the n-gram tier was fitted on, so --incremental can refit it.
+NGRAM_TRAINING_SET_PATH = "model/ngram_training_set.npz"
+
+EMBEDDER_NAME = 'all-MiniLM-L6-v2'
+
+# Rows read from the CSV at a time; text preparation and encoding run per
+# chunk, so the raw DataFrame never has to fit in memory at once.
+CSV_CHUNK_SIZE = 200_000
 
 # ----- Step: Load Pre-Generated Synthetic Data -----
 def load_synthetic_data(file_path):
-    df = pd.read_csv(file_path)
+    df = read_transactions(file_path)
     print(f"✅ Loaded synthetic data with {len(df)} samples from {file_path}")
     return df
 
+def save_training_set(X_vec, y, path=TRAINING_SET_PATH):
+    np.savez(path, X=np.asarray(X_vec, dtype=np.float32), y=np.asarray(y, dtype=str))
+
+def load_training_set(path=TRAINING_SET_PATH):
+    with np.load(path, allow_pickle=False) as saved:
+        return saved["X"], saved["y"]
+
+def save_ngram_training_set(texts, y, path=NGRAM_TRAINING_SET_PATH):
+    np.savez(path, texts=np.asarray(texts, dtype=str), y=np.asarray(y, dtype=str))
+
+def load_ngram_training_set(path=NGRAM_TRAINING_SET_PATH):
+    with np.load(path, allow_pickle=False) as saved:
+        return saved["texts"].tolist(), saved["y"]
+
+def encode_texts(texts, model_name_or_path, workers=1, use_store=True):
+    # Re-runs only encode texts the on-disk embedding store hasn't seen for this model.
+    if use_store:
+        return encode_with_store(texts, model_name_or_path, workers=workers)
+    return encode_parallel(texts, model_name_or_path, workers=workers)
+
+def embed_labelled_csv(file_path, encode_workers=1, use_store=True, chunksize=CSV_CHUNK_SIZE):
+    # Returns (X_vec, y, first chunk's texts).
+    X_parts, y_parts, sample_texts = [], [], None
+    for chunk in read_transactions(file_path, chunksize=chunksize):
+        # Combine Description, Type, and Amount for richer context.
+        texts = build_input_texts(chunk)
+        if sample_texts is None:
+            sample_texts = texts
+        X_parts.append(encode_texts(texts, EMBEDDER_NAME, workers=encode_workers, use_store=use_store))
+        y_parts.append(chunk['Category'].astype(str).to_numpy())
+    X_vec, y = np.concatenate(X_parts), np.concatenate(y_parts)
+    print(f"✅ Loaded and embedded {len(y)} samples from {file_path}")
+    return X_vec, y, sample_texts
+
+def save_model_atomically(model, path="model/classifier.pkl"):
+    # A running server.py polls this file; never let it see a half-written pickle.
+    tmp_path = f"{path}.tmp"
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, path)
+
 # ----- Step: Train the Ensemble Model and Save -----
-def train_and_save():
+def train_and_save(onnx=False, quantize=False, encode_workers=1, use_store=True, chunksize=CSV_CHUNK_SIZE,
+                   search_workers=None, search_threads=2, halving_eta=3):
     data_file = "synthetic_data.csv"
-    df = load_synthetic_data(data_file)
-
-    # Prepare training input: combine Description, Type, and Amount for richer context.
-    # We assume that the synthetic data already contains columns "Description", "Type", and "Amount"
-    X_text = df.apply(
-        lambda row: f"{normalize_text(row['Description'])} | {row['Type'].lower()} | amount: {row['Amount']}", axis=1
-    ).tolist()
-    y = df['Category']
+    X_vec, y, X_text = embed_labelled_csv(data_file, encode_workers=encode_workers, use_store=use_store,
+                                          chunksize=chunksize)
 
     print("🔍 Loading SentenceTransformer embedding model...")
-    embedder = SentenceTransformer('all-MiniLM-L6-v2')
-    X_vec = embedder.encode(X_text)
-
-    print("🧠 Setting up ensemble classifier...")
-    # Instantiate base classifiers.
-    clf_lr = LogisticRegression(max_iter=3000, C=1.0, solver='lbfgs', n_jobs=-1)
-    # Force XGBoost to use the CPU-based 'hist' tree method.
-    clf_xgb = xgb.XGBClassifier(tree_method='hist', eval_metric='mlogloss')
-
-    # Create the voting ensemble (using soft voting to average probabilities).
-    ensemble = VotingClassifier(
-        estimators=[('lr', clf_lr), ('xgb', clf_xgb)],
-        voting='soft',
-        n_jobs=-1
-    )
-
-    # Set up GridSearchCV with a small parameter grid.
-    param_grid = {
-        'lr__C': [0.5, 1.0, 2.0],
-        'xgb__max_depth': [3, 5, 7]
-    }
-    grid = GridSearchCV(ensemble, param_grid, cv=3, n_jobs=1, scoring='accuracy', error_score='raise')
-    grid.fit(X_vec, y)
-    best_model = grid.best_estimator_
-    print(f"📊 Best CV Accuracy: {grid.best_score_*100:.2f}%")
-    print("Best Params:", grid.best_params_)
-
-    # Evaluate the best model with 5-fold cross-validation.
-    cv_scores = cross_val_score(best_model, X_vec, y, cv=5, n_jobs=1)
-    print(f"📊 Final Cross-validation accuracy: {cv_scores.mean()*100:.2f}% ± {cv_scores.std()*100:.2f}%")
+    embedder = SentenceTransformer(EMBEDDER_NAME)
+
+    # Successive-halving search across a process pool, resumable from model/hparam_search/.
+    print("🧠 Searching ensemble hyperparameters...")
+    best_params, fold_scores = hparam_search.search(X_vec, y, workers=search_workers, threads=search_threads,
+                                                    eta=halving_eta)
+    print(f"📊 Best CV Accuracy: {np.mean(fold_scores)*100:.2f}% ± {np.std(fold_scores)*100:.2f}%")
+    print("Best Params:", best_params)
+
+    # The final fit gets every core: no other trials are competing for them.
+    best_model = hparam_search.build_ensemble(best_params).fit(X_vec, y)
 
     os.makedirs("model/embedder", exist_ok=True)
     os.makedirs("model", exist_ok=True)
 
+    print("🧪 Distilling the ensemble into a single linear model...")
+    student = compare_distilled(best_model, X_vec, y)
+
+    # Saved before any classifier artifact, so a server never pairs a new
+    # classifier with the previous n-gram tier.
+    print("🔤 Training the character n-gram first tier...")
+    texts, _ = read_ngram_inputs(data_file, chunksize=chunksize)
+    compare_cascade(student, X_vec, texts, y, embedder, X_text)
+    NgramClassifier.fit(texts, y).save()
+    save_ngram_training_set(texts, y)
+
     print("💾 Saving ensemble classifier...")
-    joblib.dump(best_model, "model/classifier.pkl")
+    save_model_atomically(best_model)
+    save_training_set(X_vec, y)
 
     print("💾 Saving embedder (SentenceTransformer)...")
     embedder.save("model/embedder")
 
+    distill(best_model, X_vec).save()
+
     from sklearn.metrics import accuracy_score
     preds = best_model.predict(X_vec)
     acc = accuracy_score(y, preds)
     print(f"✅ Training complete. Ensemble model accuracy on synthetic training data: {acc*100:.2f}%")
 
+    if onnx:
+        from onnx_backend import export_onnx
+        export_onnx(embedder, best_model, X_text[:1000], quantize=quantize)
+
+# ----- Step: Distill the Ensemble into a Single Linear Model -----
+def distill(teacher, X_vec):
+    from distill import DistilledClassifier
+    return DistilledClassifier.fit(X_vec, teacher.predict_proba(X_vec), teacher.classes_)
+
+def time_predictions(model, X, singles=200):
+    # (ms per 1k rows in one batch, ms per single-row call)
+    start = time.perf_counter()
+    model.predict_proba(X)
+    batch_ms = (time.perf_counter() - start) * 1000 / len(X) * 1000
+    start = time.perf_counter()
+    for row in X[:singles]:
+        model.predict_proba(row.reshape(1, -1))
+    return batch_ms, (time.perf_counter() - start) * 1000 / min(singles, len(X))
+
+def compare_distilled(teacher, X_vec, y, test_size=0.2):
+    # Held-out comparison: the ensemble (same hyperparameters) is refitted on a
+    # training split and the student distilled from that refit.
+    from sklearn.base import clone
+    from sklearn.model_selection import train_test_split
+
+    X_train, X_test, y_train, y_test = train_test_split(X_vec, np.asarray(y), test_size=test_size,
+                                                        stratify=y, random_state=42)
+    ensemble = clone(teacher).fit(X_train, y_train)
+    student = distill(ensemble, X_train)
+    teacher_pred = ensemble.predict(X_test)
+    print(f"{'model':<10} {'accuracy':>9} {'agreement':>10} {'batch ms/1k':>12} {'single ms':>10} {'size MB':>8}")
+    for name, model in (("ensemble", ensemble), ("distilled", student)):
+        pred = model.predict(X_test)
+        batch_ms, single_ms = time_predictions(model, X_test)
+        size_mb = len(pickle.dumps(model)) / 1e6
+        print(f"{name:<10} {np.mean(pred == y_test)*100:>8.2f}% {np.mean(pred == teacher_pred)*100:>9.2f}% "
+              f"{batch_ms:>12.2f} {single_ms:>10.3f} {size_mb:>8.2f}")
+    return student
+
+def distill_saved(compare=True):
+    teacher = joblib.load("model/classifier.pkl")
+    X_vec, y = load_training_set()
+    if compare:
+        compare_distilled(teacher, X_vec, y)
+    distill(teacher, X_vec).save()
+    print("💾 Saved distilled classifier to model/distilled.npz")
+
+# ----- Step: Character N-gram First Tier -----
+def read_ngram_inputs(file_path, chunksize=CSV_CHUNK_SIZE):
+    # (n-gram texts, labels) in CSV order, the same order embed_labelled_csv() uses.
+    texts, y_parts = [], []
+    for chunk in read_transactions(file_path, chunksize=chunksize):
+        texts.extend(ngram_texts(chunk))
+        y_parts.append(chunk['Category'].astype(str).to_numpy())
+    return texts, np.concatenate(y_parts)
+
+def time_texts(fn, texts, singles=50):
+    # (ms per 1k texts in one batch, ms per single-text call)
+    start = time.perf_counter()
+    fn(texts)
+    batch_ms = (time.perf_counter() - start) * 1000 / len(texts) * 1000
+    start = time.perf_counter()
+    for text in texts[:singles]:
+        fn([text])
+    return batch_ms, (time.perf_counter() - start) * 1000 / min(singles, len(texts))
+
+def compare_cascade(student, X_vec, texts, y, embedder, model_texts, min_confidence=NGRAM_MIN_CONFIDENCE,
+                    test_size=0.2):
+    # Held-out comparison of the served single-tier path (embedder + distilled
+    # model, `student` from compare_distilled on the same split) with the
+    # cascade: the n-gram model answers rows it is at least min_confidence
+    # sure about and the rest fall through to the single-tier path.
+    from sklearn.model_selection import train_test_split
+
+    y = np.asarray(y)
+    train, test = train_test_split(np.arange(len(y)), test_size=test_size, stratify=y, random_state=42)
+    ngram = NgramClassifier.fit([texts[i] for i in train], y[train])
+    test_texts = [texts[i] for i in test]
+    proba = ngram.predict_proba(test_texts)
+    first_tier = proba.max(axis=1) >= min_confidence
+    single_pred = student.predict(X_vec[test])
+    cascade_pred = np.where(first_tier, ngram.classes_[np.argmax(proba, axis=1)], single_pred)
+
+    # Latency: the single-tier path is embedder + classifier; the cascade always
+    # runs the n-gram model and pays for the rest only on rows that fall through.
+    sample = model_texts[:500]
+    embed_batch, embed_single = time_texts(embedder.encode, sample)
+    clf_batch, clf_single = time_predictions(student, X_vec[test][:len(sample)])
+    ngram_batch, ngram_single = time_texts(ngram.predict_proba, test_texts[:len(sample)])
+    fall_through = 1 - first_tier.mean()
+
+    y_test = y[test]
+    print(f"{'tier':<8} {'rows':>7} {'share':>7} {'accuracy':>9}")
+    for name, mask in (("ngram", first_tier), ("model", ~first_tier)):
+        acc = np.mean(cascade_pred[mask] == y_test[mask]) * 100 if mask.any() else float("nan")
+        print(f"{name:<8} {mask.sum():>7} {mask.mean()*100:>6.1f}% {acc:>8.2f}%")
+    print(f"{'path':<12} {'accuracy':>9} {'batch ms/1k':>12} {'single ms':>10}")
+    for name, pred, batch_ms, single_ms in (
+        ("single-tier", single_pred, embed_batch + clf_batch, embed_single + clf_single),
+        ("cascade", cascade_pred, ngram_batch + fall_through * (embed_batch + clf_batch),
+         ngram_single + fall_through * (embed_single + clf_single)),
+    ):
+        print(f"{name:<12} {np.mean(pred == y_test)*100:>8.2f}% {batch_ms:>12.2f} {single_ms:>10.3f}")
+
+def train_ngram_saved(data_file="synthetic_data.csv", chunksize=CSV_CHUNK_SIZE, test_size=0.2):
+    # Refit just the n-gram tier from the labelled CSV (no embeddings needed).
+    from sklearn.model_selection import train_test_split
+
+    texts, y = read_ngram_inputs(data_file, chunksize=chunksize)
+    train, test = train_test_split(np.arange(len(y)), test_size=test_size, stratify=y, random_state=42)
+    ngram = NgramClassifier.fit([texts[i] for i in train], y[train])
+    proba = ngram.predict_proba([texts[i] for i in test])
+    pred = ngram.classes_[np.argmax(proba, axis=1)]
+    confident = proba.max(axis=1) >= NGRAM_MIN_CONFIDENCE
+    print(f"📊 N-gram tier held-out accuracy: {np.mean(pred == y[test])*100:.2f}%, "
+          f"{confident.mean()*100:.1f}% of rows at confidence ≥ {NGRAM_MIN_CONFIDENCE} "
+          f"({np.mean(pred[confident] == y[test][confident])*100:.2f}% correct)")
+    NgramClassifier.fit(texts, y).save()
+    save_ngram_training_set(texts, y)
+    print("💾 Saved n-gram classifier to model/ngram.npz")
+
+def update_ngram(df_new):
+    # Refit the n-gram tier on its stored texts plus the new rows. Without the
+    # stored texts it can't learn the corrections, so it is removed instead of
+    # left answering with stale predictions (servers then skip the tier).
+    if not os.path.exists(NGRAM_TRAINING_SET_PATH):
+        if os.path.exists(NGRAM_PATH):
+            os.remove(NGRAM_PATH)
+            print(f"⚠️ Removed {NGRAM_PATH}: no {NGRAM_TRAINING_SET_PATH} to refit it from "
+                  f"(run `python train_model.py --ngram-only`)")
+        return
+    texts, y = load_ngram_training_set()
+    texts += ngram_texts(df_new)
+    y = np.concatenate([y, df_new['Category'].astype(str).to_numpy()])
+    print(f"🔤 Refitting the n-gram tier with {len(df_new)} new transactions...")
+    NgramClassifier.fit(texts, y).save()
+    save_ngram_training_set(texts, y)
+
+# ----- Step: Export Saved Models to ONNX (no retraining) -----
+def export_saved_to_onnx(quantize=False):
+    from onnx_backend import export_onnx
+
+    df = load_synthetic_data("synthetic_data.csv")
+    # Same input strings the server builds.
+    sample_texts = build_input_texts(df.sample(n=min(1000, len(df)), random_state=0))
+
+    embedder = SentenceTransformer("model/embedder")
+    clf = joblib.load("model/classifier.pkl")
+    export_onnx(embedder, clf, sample_texts, quantize=quantize)
+
+# ----- Step: Incremental Update from Newly Labelled Transactions -----
+def replay_sample(y, n, seed=42):
+    # Stratified sample of old rows, at least one per class, so the update
+    # does not forget categories that are absent from the new rows.
+    rng = np.random.default_rng(seed)
+    picked = []
+    for label in np.unique(y):
+        idx = np.flatnonzero(y == label)
+        take = max(1, int(round(n * len(idx) / len(y))))
+        picked.append(rng.choice(idx, size=min(take, len(idx)), replace=False))
+    return np.concatenate(picked)
+
+def update_incrementally(new_files, replay_ratio=5, xgb_rounds=20, encode_workers=1, use_store=True):
+    model = joblib.load("model/classifier.pkl")
+    if not os.path.exists(TRAINING_SET_PATH):
+        raise SystemExit(f"❌ {TRAINING_SET_PATH} not found; run a full training first.")
+    X_old, y_old = load_training_set()
+
+    df_new = pd.concat([load_synthetic_data(f) for f in new_files], ignore_index=True)
+    # Only the new rows are encoded.
+    X_new = encode_texts(build_input_texts(df_new), "model/embedder", workers=encode_workers, use_store=use_store)
+    y_new = df_new['Category'].astype(str).to_numpy()
+    X_all = np.concatenate([X_old, X_new])
+    y_all = np.concatenate([y_old, y_new])
+
+    unseen = sorted(set(y_new) - set(model.classes_))
+    if unseen:
+        # The ensemble's classes are fixed at fit time; refit it with its current
+        # hyperparameters (still no grid search or cross-validation).
+        print(f"⚠️ New categories {unseen}: refitting the ensemble on all cached embeddings")
+        from sklearn.base import clone
+        model = clone(model).fit(X_all, y_all)
+    else:
+        print(f"🧠 Updating ensemble with {len(y_new)} new transactions...")
+        lr, xgb_clf = model.estimators_
+        # LogisticRegression: warm-start from the current coefficients on all rows (cheap, it converges fast).
+        lr.set_params(warm_start=True)
+        lr.fit(X_all, model.le_.transform(y_all))
+        # XGBoost: add a few boosting rounds on the new rows plus a replay of old ones.
+        replay = replay_sample(y_old, replay_ratio * len(y_new))
+        X_upd = np.concatenate([X_new, X_old[replay]])
+        y_upd = model.le_.transform(np.concatenate([y_new, y_old[replay]]))
+        booster = xgb_clf.get_booster()
+        xgb_clf.set_params(n_estimators=xgb_rounds)
+        xgb_clf.fit(X_upd, y_upd, xgb_model=booster)
+
+    from sklearn.metrics import accuracy_score
+    print(f"📊 Accuracy on the new transactions: {accuracy_score(y_new, model.predict(X_new))*100:.2f}%")
+
+    # Before the classifier, like a full training.
+    update_ngram(df_new)
+
+    print("💾 Saving updated classifier (running servers pick it up automatically)...")
+    save_model_atomically(model)
+    save_training_set(X_all, y_all)
+    # Servers use the distilled model by default, so it follows the ensemble.
+    distill(model, X_all).save()
+
 if __name__ == "__main__":
-    train_and_save()
+    parser = argparse.ArgumentParser(description="Train the transaction categorizer.")
+    parser.add_argument("--onnx", action="store_true", help="also export ONNX models to model/onnx")
+    parser.add_argument("--onnx-only", action="store_true", help="export the saved models to ONNX without retraining")
+    parser.add_argument("--quantize", action="store_true", help="also write an int8-quantized ONNX embedder")
+    parser.add_argument("--distill-only", action="store_true",
+                        help="distill the saved ensemble into model/distilled.npz and compare them, without retraining")
+    parser.add_argument("--ngram-only", action="store_true",
+                        help="train the character n-gram first tier into model/ngram.npz, without retraining")
+    parser.add_argument("--incremental", nargs="+", metavar="CSV",
+                        help="update the saved model with newly labelled transactions instead of retraining")
+    parser.add_argument("--replay-ratio", type=int, default=5, help="old rows replayed per new row in --incremental")
+    parser.add_argument("--encode-workers", type=int, default=max(1, (os.cpu_count() or 1) // 2),
+                        help="processes used to encode texts missing from the embedding store")
+    parser.add_argument("--no-embedding-store", action="store_true",
+                        help="encode everything and don't read or write model/embedding_store")
+    parser.add_argument("--chunksize", type=int, default=CSV_CHUNK_SIZE, help="CSV rows read and encoded at a time")
+    parser.add_argument("--search-workers", type=int, help="hyperparameter search processes (default: cores / threads)")
+    parser.add_argument("--search-threads", type=int, default=2, help="threads per search trial")
+    parser.add_argument("--halving-eta", type=int, default=3,
+                        help="keep the best 1/eta candidates per successive-halving rung (1 = full grid)")
+    args = parser.parse_args()
+    use_store = not args.no_embedding_store
+
+    if args.incremental:
+        update_incrementally(args.incremental, replay_ratio=args.replay_ratio,
+                             encode_workers=args.encode_workers, use_store=use_store)
+    elif args.distill_only:
+        distill_saved()
+    elif args.ngram_only:
+        train_ngram_saved(chunksize=args.chunksize)
+    elif args.onnx_only:
+        export_saved_to_onnx(quantize=args.quantize)
+    else:
+        train_and_save(onnx=args.onnx, quantize=args.quantize, encode_workers=args.encode_workers, use_store=use_store,
+                       chunksize=args.chunksize, search_workers=args.search_workers,
+                       search_threads=args.search_threads, halving_eta=args.halving_eta)
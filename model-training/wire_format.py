@@ -0,0 +1,77 @@
+import json
+
+import msgpack
+
+try:
+    import orjson
+except ImportError:  # stdlib json is the slower fallback
+    orjson = None
+
+# Wire formats of /bulk_predict, chosen by Content-Type (request) and Accept
+# (response):
+#   application/json     {"transactions": [{"description": ..., ...}, ...]}
+#   application/x-msgpack {"description": [...], "transactionType": [...], ...}
+# MessagePack carries columns: one array per field, all the same length, so
+# field names are sent once instead of once per row.
+JSON = "application/json"
+MSGPACK = "application/x-msgpack"
+FORMATS = [JSON, MSGPACK]
+MSGPACK_ALIASES = {MSGPACK, "application/msgpack", "application/vnd.msgpack"}
+
+
+def dumps_json(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+def loads_json(body):
+    if orjson is not None:
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            pass  # NaN / Infinity, which the stdlib accepts and orjson doesn't
+    return json.loads(body)
+
+
+def request_format(mimetype):
+    return MSGPACK if mimetype in MSGPACK_ALIASES else JSON
+
+
+def decode_columns(body):
+    """{field: values} from a MessagePack body; ValueError if it isn't equal-length columns."""
+    try:
+        columns = msgpack.unpackb(body, raw=False)
+    except Exception as e:
+        raise ValueError(f"Invalid MessagePack body ({type(e).__name__})")
+    if not isinstance(columns, dict) or not all(isinstance(v, list) for v in columns.values()):
+        raise ValueError("Expected a MessagePack map of column name -> array")
+    if len({len(v) for v in columns.values()}) > 1:
+        raise ValueError("All columns must have the same length")
+    return columns
+
+
+def columns_to_rows(columns):
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+def rows_to_columns(rows):
+    names = dict.fromkeys(name for row in rows for name in row)
+    return {name: [row.get(name) for row in rows] for name in names}
+
+
+def result_columns(predictions):
+    # predictions: (category, confidence, source) per row, in input order.
+    return {
+        "category": [category for category, _, _ in predictions],
+        "confidence": [round(confidence, 3) for _, confidence, _ in predictions],
+        "source": [source for _, _, source in predictions],
+    }
+
+
+def encode(obj, fmt):
+    """(body, mimetype) of obj in the given format."""
+    if fmt == MSGPACK:
+        return msgpack.packb(obj, use_bin_type=True), MSGPACK
+    return dumps_json(obj), JSON